@@ -0,0 +1,409 @@
+#! /usr/bin/env python3
+
+import os
+import sys
+import argparse
+import sqlite3
+import itertools
+import multiprocessing as mp
+import xml.etree.ElementTree as ET
+from collections import Counter
+import pandas as pd
+from tabulate import tabulate
+import reportstore
+
+"""
+This script builds a precomputed cube of file counts over all experiments
+(collections) in an output directory, and renders slices and cross tables
+from it. A collection is any directory that contains JHOVE and VeraPDF
+output files (e.g. ae-fonts, horror, jhove-pdfhul-impact/pdf-hul-36), or for
+the sharded and sqlite report stores (see reportstore.py) the directory part
+of the file IDs.
+The dimensions of the cube are:
+
+- collection
+- jhoveStatus: JHOVE validation status
+- veraParseErrors: VeraPDF parse errors (True/False)
+- veraLogWarnings: VeraPDF logged warnings (True/False)
+- annotSubtype: annotation subtype (from VeraPDF features)
+- actionType: action type (from VeraPDF features)
+
+A file can have several annotation subtypes and action types, so besides the
+actual values each dimension (except collection) also has a "*" value that
+stands for "any value". Each file is counted once in every combination of its
+own values and "*". As a result, every slice or cross table (including its
+margins) is a direct lookup of exact file counts, even for the multi-valued
+dimensions. Values that are missing (e.g. no annotations) are coded as
+"(none)".
+
+The cube is stored in an SQLite database. Collections are parsed by parallel
+workers, and when the cube is updated only collections whose output files have
+changed since the previous build (according to the fingerprint of their reports
+in the store) are parsed again.
+
+Python requirements:
+
+- Pandas (https://pypi.org/project/pandas/)
+- Tabulate https://pypi.org/project/tabulate/)
+"""
+
+dimensions = ["collection", "jhoveStatus", "veraParseErrors", "veraLogWarnings",
+              "annotSubtype", "actionType"]
+
+jhoveNS = "{http://schema.openpreservation.org/ois/xml/ns/jhove}"
+
+# Create parser
+parser = argparse.ArgumentParser(
+description="Build and query cube of JHOVE/VeraPDF results over all collections")
+
+def parseCommandLine():
+    # Add arguments
+
+    parser.add_argument('dirIn',
+                        action="store",
+                        type=str,
+                        help="output directory with one subdirectory per collection")
+    parser.add_argument('dbOut',
+                        action="store",
+                        type=str,
+                        help="cube database file")
+    parser.add_argument('--store',
+                        action="store",
+                        type=str,
+                        choices=reportstore.layouts,
+                        dest="store",
+                        default="flat",
+                        help="layout of report store (flat stores are searched recursively)")
+    parser.add_argument('--existingcube', '-e',
+                        action="store_true",
+                        dest="existingCubeFlag",
+                        default=False,
+                        help="don't update cube, but query existing cube")
+    parser.add_argument('--rebuild',
+                        action="store_true",
+                        dest="rebuildFlag",
+                        default=False,
+                        help="parse all collections, including unchanged ones")
+    parser.add_argument('--workers', '-w',
+                        action="store",
+                        type=int,
+                        dest="workers",
+                        default=os.cpu_count(),
+                        help="number of parallel workers")
+    parser.add_argument('--rows',
+                        action="store",
+                        type=str,
+                        choices=dimensions,
+                        dest="rows",
+                        default="collection",
+                        help="dimension for rows of cross table")
+    parser.add_argument('--columns',
+                        action="store",
+                        type=str,
+                        choices=dimensions,
+                        dest="columns",
+                        default="jhoveStatus",
+                        help="dimension for columns of cross table")
+    parser.add_argument('--where',
+                        action="append",
+                        type=str,
+                        dest="where",
+                        default=[],
+                        help="only count files with dimension=value (can be repeated)")
+
+    # Parse arguments
+    args = parser.parse_args()
+
+    return(args)
+
+
+def errorExit(msg):
+    """Print error to stderr and exit"""
+    msgString = ("Error: " + msg + "\n")
+    sys.stderr.write(msgString)
+    sys.exit(1)
+
+
+def getJhoveValues(root):
+
+    """
+    Return validation status from JHOVE output
+    """
+
+    statusElt = root.find(".//" + jhoveNS + "repInfo/" + jhoveNS + "status")
+
+    if statusElt is None:
+        return "(none)"
+
+    return statusElt.text
+
+
+def getVeraPDFValues(root):
+
+    """
+    Return parse error and warning flags, and sets of annotation subtypes and
+    action types from VeraPDF output
+    """
+
+    parseErrors = False
+    logWarnings = False
+    annots = set()
+    actions = set()
+
+    for taskResult in root.iter("taskResult"):
+        if taskResult.get("type") == "PARSE" and taskResult.get("isSuccess") == "false":
+            parseErrors = True
+
+    for logMessage in root.iter("logMessage"):
+        if logMessage.get("level") == "WARNING":
+            logWarnings = True
+
+    for annotation in root.iter("annotation"):
+        subType = annotation.find(".//subType")
+        if subType is not None and subType.text:
+            annots.add(subType.text)
+
+    for action in root.iter("action"):
+        actionType = action.get("type")
+        if actionType:
+            actions.add(actionType)
+
+    return str(parseErrors), str(logWarnings), annots, actions
+
+
+def countFiles(batch):
+
+    """
+    Worker function: parse JHOVE and VeraPDF output for a batch of files from
+    one collection, and return counts of all cube cells for these files
+    """
+
+    dirIn, layout, collection, fileIDs = batch
+
+    store = reportstore.openStore(dirIn, layout)
+    counts = Counter()
+
+    for fileID in fileIDs:
+        jhoveStatus = "(none)"
+        veraParseErrors = "(none)"
+        veraLogWarnings = "(none)"
+        annots = set()
+        actions = set()
+
+        try:
+            with store.open(fileID, "jhove") as f:
+                jhoveStatus = getJhoveValues(ET.parse(f).getroot())
+        except (FileNotFoundError, ET.ParseError):
+            pass
+
+        try:
+            with store.open(fileID, "vera") as f:
+                veraParseErrors, veraLogWarnings, annots, actions = getVeraPDFValues(ET.parse(f).getroot())
+        except (FileNotFoundError, ET.ParseError):
+            pass
+
+        values = [[jhoveStatus],
+                  [veraParseErrors],
+                  [veraLogWarnings],
+                  sorted(annots) or ["(none)"],
+                  sorted(actions) or ["(none)"]]
+
+        # Count file once in every combination of its values and "*"
+        for cell in itertools.product(*[value + ["*"] for value in values]):
+            counts[(collection,) + cell] += 1
+
+    store.close()
+
+    return collection, counts
+
+
+def findCollections(store):
+
+    """
+    Return dictionary that maps each collection (directory part of file ID)
+    to the sorted list of file IDs of its output files in store
+    """
+
+    collections = {}
+
+    for fileID, tool in store.ids():
+        collection = os.path.dirname(fileID)
+        if collection == "":
+            collection = "."
+        collections.setdefault(collection, set()).add(fileID)
+
+    return {collection: sorted(fileIDs) for collection, fileIDs in collections.items()}
+
+
+def openCube(dbOut):
+
+    """
+    Open cube database, and create tables if they don't exist yet
+    """
+
+    conn = sqlite3.connect(dbOut)
+    conn.execute("""CREATE TABLE IF NOT EXISTS collections (
+                    collection TEXT PRIMARY KEY,
+                    fingerprint TEXT,
+                    files INTEGER)""")
+    conn.execute("""CREATE TABLE IF NOT EXISTS cube (
+                    collection TEXT,
+                    jhoveStatus TEXT,
+                    veraParseErrors TEXT,
+                    veraLogWarnings TEXT,
+                    annotSubtype TEXT,
+                    actionType TEXT,
+                    files INTEGER)""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idxCube ON cube (collection)")
+    conn.commit()
+
+    return conn
+
+
+def updateCube(dirIn, layout, dbOut, workers, rebuildFlag):
+
+    """
+    Parse all new or changed collections with parallel workers, and replace
+    their cells in the cube. Cells of collections that no longer exist are
+    removed. Returns list of collections that were parsed
+    """
+
+    store = reportstore.openStore(dirIn, layout)
+    collections = findCollections(store)
+    fingerprints = {collection: store.fingerprint(fileIDs) for collection, fileIDs in collections.items()}
+    store.close()
+
+    if not collections:
+        errorExit("no JHOVE or VeraPDF output found in input directory")
+
+    conn = openCube(dbOut)
+    stored = dict(conn.execute("SELECT collection, fingerprint FROM collections").fetchall())
+
+    # Remove collections that no longer exist
+    for collection in set(stored) - set(collections):
+        conn.execute("DELETE FROM cube WHERE collection = ?", (collection,))
+        conn.execute("DELETE FROM collections WHERE collection = ?", (collection,))
+
+    # Find new or changed collections
+    changed = [collection for collection in sorted(collections)
+               if rebuildFlag or stored.get(collection) != fingerprints[collection]]
+
+    # Split changed collections into batches, so large collections are
+    # spread over several workers
+    batches = []
+    for collection in changed:
+        fileIDs = collections[collection]
+        batchSize = 500
+        for i in range(0, len(fileIDs), batchSize):
+            batches.append((dirIn, layout, collection, fileIDs[i:i + batchSize]))
+
+    counts = {collection: Counter() for collection in changed}
+
+    if batches:
+        workers = max(1, min(workers, len(batches)))
+        if workers == 1:
+            results = map(countFiles, batches)
+            for collection, partCounts in results:
+                counts[collection].update(partCounts)
+        else:
+            with mp.Pool(workers) as pool:
+                for collection, partCounts in pool.imap_unordered(countFiles, batches):
+                    counts[collection].update(partCounts)
+
+    # Replace cells of changed collections
+    for collection in changed:
+        conn.execute("DELETE FROM cube WHERE collection = ?", (collection,))
+        conn.executemany("INSERT INTO cube VALUES (?, ?, ?, ?, ?, ?, ?)",
+                         [cell + (count,) for cell, count in counts[collection].items()])
+        conn.execute("INSERT OR REPLACE INTO collections VALUES (?, ?, ?)",
+                     (collection, fingerprints[collection], len(collections[collection])))
+
+    conn.commit()
+    conn.close()
+
+    return changed
+
+
+def crossTable(dbOut, rows, columns, where):
+
+    """
+    Return dataframe with cross table of file counts for dimensions rows and
+    columns, for files that match all dimension=value conditions in where.
+    Dimensions that are not used are set to "*" (any value); the "*" values
+    of rows and columns give the margins. The collection dimension has no "*"
+    value in the cube, so its margin is the sum over all collections
+    """
+
+    conditions = []
+    params = []
+
+    for dimension in dimensions:
+        if dimension in (rows, columns):
+            continue
+        if dimension in where:
+            conditions.append(dimension + " = ?")
+            params.append(where[dimension])
+        elif dimension != "collection":
+            conditions.append(dimension + " = '*'")
+
+    query = ("SELECT " + rows + ", " + columns + ", SUM(files) FROM cube WHERE " +
+             " AND ".join(conditions) + " GROUP BY " + rows + ", " + columns)
+
+    conn = sqlite3.connect(dbOut)
+    cells = conn.execute(query, params).fetchall()
+    conn.close()
+
+    df = pd.DataFrame(cells, columns=[rows, columns, "files"])
+    table = df.pivot_table(index=rows, columns=columns, values="files",
+                           aggfunc="sum", fill_value=0)
+
+    if rows == "collection":
+        table.loc["*"] = table.sum(axis=0)
+    if columns == "collection":
+        table["*"] = table.sum(axis=1)
+
+    # Show "any value" margins as "All" in last row and column, like pandas
+    # crosstab does
+    table = table.reindex(index=[i for i in table.index if i != "*"] + ["*"],
+                          columns=[c for c in table.columns if c != "*"] + ["*"],
+                          fill_value=0)
+    table = table.rename(index={"*": "All"}, columns={"*": "All"})
+
+    return table
+
+
+def main():
+    """Main function"""
+
+    # User input
+    args = parseCommandLine()
+    dirIn = os.path.abspath(args.dirIn)
+    dbOut = os.path.abspath(args.dbOut)
+
+    if args.rows == args.columns:
+        errorExit("rows and columns must be different dimensions")
+
+    where = {}
+    for condition in args.where:
+        dimension, sep, value = condition.partition("=")
+        if not sep or dimension not in dimensions:
+            errorExit("invalid --where condition: " + condition)
+        if dimension in (args.rows, args.columns):
+            errorExit("--where dimension can't be rows or columns dimension: " + dimension)
+        where[dimension] = value
+
+    if not args.existingCubeFlag:
+        # Check if input directory exists
+        if not os.path.isdir(dirIn):
+            errorExit("input directory does not exist")
+        changed = updateCube(dirIn, args.store, dbOut, args.workers, args.rebuildFlag)
+        sys.stderr.write("Updated " + str(len(changed)) + " collection(s)\n")
+    elif not os.path.isfile(dbOut):
+        errorExit("cube file not found, try running without --existingcube option")
+
+    table = crossTable(dbOut, args.rows, args.columns, where)
+    print(tabulate(table, headers='keys', tablefmt='pipe'))
+
+
+if __name__ == "__main__":
+    main()
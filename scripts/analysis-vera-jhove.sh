@@ -5,9 +5,10 @@
 # Python scripts that extract output on Actions and Annotations. The
 # output is subsequently written to 3 Markdown formatted tables.
 
-# Locations of VeraPDF and JHOVE
-veraPDF=~/verapdf/verapdf
-jhove=~/jhove/jhove
+# Locations of VeraPDF and JHOVE (override with VERAPDF_BIN and JHOVE_BIN
+# environment variables)
+veraPDF="${VERAPDF_BIN:-$HOME/verapdf/verapdf}"
+jhove="${JHOVE_BIN:-$HOME/jhove/jhove}"
 
 # Installation directory
 instDir="$( cd "$( dirname "${BASH_SOURCE[0]}" )" && pwd )"
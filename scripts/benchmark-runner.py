@@ -0,0 +1,222 @@
+#! /usr/bin/env python3
+
+import os
+import sys
+import time
+import json
+import shutil
+import argparse
+import tempfile
+import subprocess as sub
+import numpy as np
+import pandas as pd
+from tabulate import tabulate
+
+scriptPath = os.path.split(os.path.realpath(__file__))[0]
+sys.path.insert(0, os.path.join(scriptPath, "stubs"))
+import toolstub
+
+"""
+This script benchmarks jhove-verapdf-validation-run.py end-to-end, using the
+stub JHOVE and VeraPDF executables in the stubs directory, which replay recorded
+reports from the output directory of this repo. It creates a synthetic corpus
+of (empty) PDFs named after the recorded reports, runs the runner on it at
+different concurrency settings, and reports throughput (files/s), per-file
+latency percentiles (from the durations recorded by the runner) and peak memory
+use of the runner. Stub latency, CPU use and failure rate are configurable, so
+results are reproducible and don't depend on real JHOVE and VeraPDF installs.
+The index of recorded reports is built once per benchmark, and passed to the
+stubs, so they don't search the replay directory on every run.
+
+Python requirements:
+
+- Pandas (https://pypi.org/project/pandas/)
+- Tabulate https://pypi.org/project/tabulate/)
+"""
+
+runnerScript = os.path.join(scriptPath, "jhove-verapdf-validation-run.py")
+stubJhove = os.path.join(scriptPath, "stubs", "jhove")
+stubVeraPDF = os.path.join(scriptPath, "stubs", "verapdf")
+
+# Create parser
+parser = argparse.ArgumentParser(
+description="Benchmark JHOVE/VeraPDF runner with stub tools")
+
+def parseCommandLine():
+    # Add arguments
+
+    parser.add_argument('--files', '-f',
+                        action="store",
+                        type=int,
+                        dest="noFiles",
+                        default=200,
+                        help="number of files in synthetic corpus")
+    parser.add_argument('--jobs', '-j',
+                        action="store",
+                        type=str,
+                        dest="jobs",
+                        default="1,2,4,8",
+                        help="comma-separated list of concurrency settings")
+    parser.add_argument('--latency',
+                        action="store",
+                        type=float,
+                        dest="latency",
+                        default=0.05,
+                        help="stub wall clock delay per run (seconds)")
+    parser.add_argument('--cpu',
+                        action="store",
+                        type=float,
+                        dest="cpu",
+                        default=0,
+                        help="stub CPU time per run (seconds)")
+    parser.add_argument('--failrate',
+                        action="store",
+                        type=float,
+                        dest="failRate",
+                        default=0,
+                        help="stub failure probability per run")
+    parser.add_argument('--runneroptions',
+                        action="store",
+                        type=str,
+                        dest="runnerOptions",
+                        default="",
+                        help="extra options for runner (e.g. \"--stream --store sqlite\")")
+    parser.add_argument('--replaydir',
+                        action="store",
+                        type=str,
+                        dest="replayDir",
+                        default=os.path.join(os.path.dirname(scriptPath), "output"),
+                        help="directory with recorded reports")
+    parser.add_argument('--out', '-o',
+                        action="store",
+                        type=str,
+                        dest="fileOut",
+                        default=None,
+                        help="write Markdown table with results to this file")
+
+    # Parse arguments
+    args = parser.parse_args()
+
+    return(args)
+
+
+def errorExit(msg):
+    """Print error to stderr and exit"""
+    msgString = ("Error: " + msg + "\n")
+    sys.stderr.write(msgString)
+    sys.exit(1)
+
+
+def makeCorpus(dirCorpus, indexFile, noFiles):
+
+    """
+    Create synthetic corpus of noFiles empty PDFs, named after recorded
+    reports in index file (with a sequence number, so names are unique)
+    """
+
+    with open(indexFile, 'r', encoding='utf-8') as f:
+        baseNames = sorted(json.load(f)["jhove"])
+
+    if not baseNames:
+        errorExit("no recorded reports found in replay directory")
+
+    for i in range(noFiles):
+        fileName = baseNames[i % len(baseNames)] + "-" + str(i) + ".pdf"
+        with open(os.path.join(dirCorpus, fileName), 'wb') as f:
+            pass
+
+
+def runBenchmark(dirCorpus, dirOut, jobs, runnerOptions, env):
+
+    """
+    Run runner on corpus with jobs parallel workers, and return wall clock
+    time, peak memory use (MB) of runner, per-file durations and number of
+    files without results
+    """
+
+    args = [sys.executable, runnerScript, dirCorpus, dirOut,
+            '--jhove', stubJhove, '--verapdf', stubVeraPDF,
+            '--jobs', str(jobs)]
+    args += runnerOptions.split()
+
+    # Stderr goes to a temporary file, as a pipe that isn't read until the
+    # runner exits would block the runner once the pipe buffer is full
+    with tempfile.TemporaryFile() as fErr:
+        start = time.perf_counter()
+        p = sub.Popen(args, stdout=sub.DEVNULL, stderr=fErr, env=env, shell=False)
+        # wait4 returns resource usage of this run only
+        pid, status, rusage = os.wait4(p.pid, 0)
+        wallTime = time.perf_counter() - start
+        p.returncode = os.waitstatus_to_exitcode(status)
+        fErr.seek(0)
+        errors = fErr.read()
+
+    if p.returncode != 0:
+        errorExit("runner failed: " + errors.decode("utf-8", errors="replace"))
+
+    # ru_maxrss is in KB on Linux
+    peakMemory = rusage.ru_maxrss / 1024
+
+    durations = pd.read_csv(os.path.join(dirOut, "durations.csv"))["duration"]
+    data = pd.read_csv(os.path.join(dirOut, "data.csv"))
+    noFailed = int(data["jhoveStatus"].isna().sum() + data["veraParseErrors"].isna().sum())
+
+    return wallTime, peakMemory, durations, noFailed
+
+
+def main():
+    """Main function"""
+
+    args = parseCommandLine()
+
+    try:
+        jobsList = [int(jobs) for jobs in args.jobs.split(",")]
+    except ValueError:
+        errorExit("jobs must be comma-separated list of integers")
+
+    # Configure stubs through environment
+    env = dict(os.environ)
+    env["STUB_REPLAY_DIR"] = os.path.abspath(args.replayDir)
+    env["STUB_LATENCY"] = str(args.latency)
+    env["STUB_CPU"] = str(args.cpu)
+    env["STUB_FAILRATE"] = str(args.failRate)
+
+    dirTemp = tempfile.mkdtemp(prefix="benchmark-runner-")
+
+    try:
+        # Index recorded reports once, instead of in every stub run
+        indexFile = os.path.join(dirTemp, "replay-index.json")
+        toolstub.writeIndex(os.path.abspath(args.replayDir), indexFile)
+        env["STUB_INDEX"] = indexFile
+
+        dirCorpus = os.path.join(dirTemp, "corpus")
+        os.makedirs(dirCorpus)
+        makeCorpus(dirCorpus, indexFile, args.noFiles)
+
+        rows = []
+
+        for jobs in jobsList:
+            dirOut = os.path.join(dirTemp, "out-" + str(jobs))
+            wallTime, peakMemory, durations, noFailed = runBenchmark(dirCorpus, dirOut, jobs,
+                                                                     args.runnerOptions, env)
+            p50, p95, p99 = np.percentile(durations, [50, 95, 99])
+            rows.append([jobs, args.noFiles, wallTime, args.noFiles / wallTime,
+                         p50, p95, p99, durations.max(), peakMemory, noFailed])
+            sys.stderr.write("jobs = " + str(jobs) + ": " + str(round(wallTime, 2)) + " s\n")
+
+    finally:
+        shutil.rmtree(dirTemp)
+
+    headers = ["jobs", "files", "time (s)", "files/s", "p50 (s)", "p95 (s)", "p99 (s)",
+               "max (s)", "peak memory (MB)", "failed tool runs"]
+    mdOut = tabulate(rows, headers=headers, tablefmt='pipe', floatfmt=".3f")
+
+    print(mdOut)
+
+    if args.fileOut is not None:
+        with open(args.fileOut, 'w', encoding='utf-8') as f:
+            f.write(mdOut + "\n")
+
+
+if __name__ == "__main__":
+    main()
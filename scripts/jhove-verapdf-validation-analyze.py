@@ -27,6 +27,17 @@ def dfToMarkdown(dataframe, headers='keys'):
     return mdOut
 
 
+# Rank of JHOVE/VeraPDF and rendering categories, from "worst" to "best"
+categoryRanks = {'Not well-formed': 0,
+                 'Well-Formed, but not valid': 1,
+                 'Well-Formed and valid': 2,
+                 True: 0,
+                 False: 1,
+                 'No': 0,
+                 'YesWithIssues': 1,
+                 'Yes': 2}
+
+
 def cramersVCorr(var1, var2):
 
     """ calculate Cramers V statistic for categorial-categorial association.
@@ -46,6 +57,83 @@ def cramersVCorr(var1, var2):
     return V, p, dof
 
 
+def ordinalStats(table):
+
+    """ calculate Kendall's tau-b, Goodman-Kruskal gamma and Somers' D (with
+    the column variable as dependent variable), and their asymptotic standard
+    errors (ASE1) from a contingency table with ordered rows and columns.
+    Concordant and discordant counts for each cell are taken from cumulative
+    sums of the table, so computation time is proportional to the size of the
+    table, not to the number of observations.
+    Formulas from SAS/STAT documentation of PROC FREQ ("Measures of Association"),
+    after Agresti, Categorical Data Analysis (2002).
+    """
+    n_ij = np.asarray(table, dtype=float)
+    r, c = n_ij.shape
+    n = n_ij.sum()
+
+    # S[i, j] = sum of all cells in rows < i and columns < j
+    S = np.zeros((r + 1, c + 1))
+    S[1:, 1:] = n_ij.cumsum(axis=0).cumsum(axis=1)
+
+    above_left = S[:-1, :-1]
+    above_right = S[:-1, c:] - S[:-1, 1:]
+    below_left = S[r:, :-1] - S[1:, :-1]
+    below_right = n - S[1:, c:] - S[r:, 1:] + S[1:, 1:]
+
+    # Cells that are concordant (A) and discordant (D) with each cell
+    A_ij = above_left + below_right
+    D_ij = above_right + below_left
+    d_ij = A_ij - D_ij
+
+    P = (n_ij * A_ij).sum()
+    Q = (n_ij * D_ij).sum()
+
+    n_i = n_ij.sum(axis=1)[:, np.newaxis]
+    n_j = n_ij.sum(axis=0)[np.newaxis, :]
+    Dr = n**2 - (n_i**2).sum()
+    Dc = n**2 - (n_j**2).sum()
+    w = np.sqrt(Dr * Dc)
+
+    gamma = (P - Q) / (P + Q)
+    gammaSE = 4 / (P + Q)**2 * np.sqrt((n_ij * (Q*A_ij - P*D_ij)**2).sum())
+
+    tauB = (P - Q) / w
+    v_ij = n_i * Dc + n_j * Dr
+    tauBVar = (n_ij * (2*w*d_ij + tauB*v_ij)**2).sum() - n**3 * tauB**2 * (Dr + Dc)**2
+    tauBSE = np.sqrt(max(tauBVar, 0)) / w**2
+
+    somersD = (P - Q) / Dr
+    somersDSE = 2 / Dr**2 * np.sqrt((n_ij * (Dr*d_ij - (P - Q)*(n - n_i))**2).sum())
+
+    return tauB, tauBSE, gamma, gammaSE, somersD, somersDSE
+
+
+def ordinalAssociation(var1, var2):
+
+    """ calculate ordinal association measures for two variables, using the
+    "worst" to "best" ordering of their categories in categoryRanks.
+    Somers' D is calculated with var2 as dependent variable.
+    """
+    table = pd.crosstab(var1, var2)
+    table = table.reindex(sorted(table.index, key=lambda x: categoryRanks[x]))
+    table = table.reindex(columns=sorted(table.columns, key=lambda x: categoryRanks[x]))
+    return ordinalStats(table.values)
+
+
+def addStatistics(dfV, desc, var1, var2):
+
+    """ add row with Cramer's V and ordinal association measures for
+    var1 and var2 to dataframe dfV
+    """
+    V, p, dof = cramersVCorr(var1, var2)
+    tauB, tauBSE, gamma, gammaSE, somersD, somersDSE = ordinalAssociation(var1, var2)
+    row = pd.DataFrame([[desc, V, p, dof, tauB, tauBSE, gamma, gammaSE, somersD, somersDSE]],
+                       columns=dfV.columns)
+    dfV = pd.concat([dfV, row], ignore_index=True)
+    return dfV
+
+
 def main():
     """ Main function"""
 
@@ -113,28 +201,29 @@ def main():
 
     # Express associations between JHOVE / VeraPDF metrics and with rendering outcomes using 
     # corrected Cramer's V statistic.
-    # Note: since these are essentially ordinal data, more powerful measures such as
-    # Kendall Tau and Somers' D, but these don't work if one of the variables is
-    # dichotomic.
     # p-values are calculated from Chi squared test.
     # See: https://towardsdatascience.com/contingency-tables-chi-squared-and-cramers-v-ada4f93ec3fd
-
-    # Create dataframe for Cramer's V reporting
-    dfV = pd.DataFrame({'desc': [], 'V': [], 'p': [], 'dof': []})
+    # Since these are essentially ordinal data, we also report Kendall's tau-b,
+    # Goodman-Kruskal gamma and Somers' D (with the second variable as dependent
+    # variable), with their asymptotic standard errors. These are calculated from
+    # the contingency tables, with all variables ordered from "worst" to "best"
+    # (for VeraPDF, True is "worst"). So positive values mean that "worse"
+    # values of one variable go together with "worse" values of the other.
+
+    # Create dataframe for reporting of association measures
+    dfV = pd.DataFrame({'desc': [], 'V': [], 'p': [], 'dof': [],
+                        'tauB': [], 'tauBSE': [], 'gamma': [], 'gammaSE': [],
+                        'somersD': [], 'somersDSE': []})
 
     ## ***********************************************************************
     ## JHOVE vs VeraPDF metrics
     ## ***********************************************************************
 
     desc = "JHOVE status vs VeraPDF parse errors"
-    V, p, dof = cramersVCorr(df['jhoveStatus'], df['veraParseErrors'])
-    row = pd.Series([desc, V, p, dof], index=['desc', 'V', 'p', 'dof'])
-    dfV = dfV.append(row, ignore_index=True)
+    dfV = addStatistics(dfV, desc, df['jhoveStatus'], df['veraParseErrors'])
 
     desc = "JHOVE status vs VeraPDF warnings"
-    V, p, dof = cramersVCorr(df['jhoveStatus'], df['veraLogWarnings'])
-    row = pd.Series([desc, V, p, dof], index=['desc', 'V', 'p', 'dof'])
-    dfV = dfV.append(row, ignore_index=True)
+    dfV = addStatistics(dfV, desc, df['jhoveStatus'], df['veraLogWarnings'])
 
     # Save original dataframe state
     dfTemp = df.copy()
@@ -147,14 +236,10 @@ def main():
     df['jhoveStatus'] = df['jhoveStatus'].replace(['Well-Formed, but not valid'], 'Not well-formed')
 
     desc = "JHOVE status vs VeraPDF parse errors (lumping JHOVE's 'Well-Formed, but not valid' and 'Not well-formed' classes)"
-    V, p, dof = cramersVCorr(df['jhoveStatus'], df['veraParseErrors'])
-    row = pd.Series([desc, V, p, dof], index=['desc', 'V', 'p', 'dof'])
-    dfV = dfV.append(row, ignore_index=True)
+    dfV = addStatistics(dfV, desc, df['jhoveStatus'], df['veraParseErrors'])
 
     desc = "JHOVE status vs VeraPDF warnings (lumping JHOVE's 'Well-Formed, but not valid' and 'Not well-formed' classes)"
-    V, p, dof = cramersVCorr(df['jhoveStatus'], df['veraLogWarnings'])
-    row = pd.Series([desc, V, p, dof], index=['desc', 'V', 'p', 'dof'])
-    dfV = dfV.append(row, ignore_index=True)
+    dfV = addStatistics(dfV, desc, df['jhoveStatus'], df['veraLogWarnings'])
 
     # Revert dataframe to original state
     df = dfTemp.copy()
@@ -163,14 +248,10 @@ def main():
     df['jhoveStatus'] = df['jhoveStatus'].replace(['Well-Formed, but not valid'], 'Well-Formed and valid')
 
     desc = "JHOVE status vs VeraPDF parse errors (lumping JHOVE's 'Well-Formed, but not valid' and 'Well-Formed and valid' classes)"
-    V, p, dof = cramersVCorr(df['jhoveStatus'], df['veraParseErrors'])
-    row = pd.Series([desc, V, p, dof], index=['desc', 'V', 'p', 'dof'])
-    dfV = dfV.append(row, ignore_index=True)
+    dfV = addStatistics(dfV, desc, df['jhoveStatus'], df['veraParseErrors'])
 
     desc = "JHOVE status vs VeraPDF warnings (lumping JHOVE's 'Well-Formed, but not valid' and 'Well-Formed and valid' classes)"
-    V, p, dof = cramersVCorr(df['jhoveStatus'], df['veraLogWarnings'])
-    row = pd.Series([desc, V, p, dof], index=['desc', 'V', 'p', 'dof'])
-    dfV = dfV.append(row, ignore_index=True)
+    dfV = addStatistics(dfV, desc, df['jhoveStatus'], df['veraLogWarnings'])
 
     # Revert dataframe to original state
     df = dfTemp.copy()
@@ -180,19 +261,13 @@ def main():
     ## ***********************************************************************
 
     desc = 'JHOVE status vs rendering'
-    V, p, dof = cramersVCorr(df['jhoveStatus'], df['rendersInAcrobat'])
-    row = pd.Series([desc, V, p, dof], index=['desc', 'V', 'p', 'dof'])
-    dfV = dfV.append(row, ignore_index=True)
+    dfV = addStatistics(dfV, desc, df['jhoveStatus'], df['rendersInAcrobat'])
 
     desc = 'VeraPDF parse errors vs rendering'
-    V, p, dof = cramersVCorr(df['veraParseErrors'], df['rendersInAcrobat'])
-    row = pd.Series([desc, V, p, dof], index=['desc', 'V', 'p', 'dof'])
-    dfV = dfV.append(row, ignore_index=True)
+    dfV = addStatistics(dfV, desc, df['veraParseErrors'], df['rendersInAcrobat'])
 
     desc = 'VeraPDF parse warnings vs rendering'
-    V, p, dof = cramersVCorr(df['veraLogWarnings'], df['rendersInAcrobat'])
-    row = pd.Series([desc, V, p, dof], index=['desc', 'V', 'p', 'dof'])
-    dfV = dfV.append(row, ignore_index=True)
+    dfV = addStatistics(dfV, desc, df['veraLogWarnings'], df['rendersInAcrobat'])
 
     ## ***********************************************************************
     ## Test effect of lumping JHOVE status classes
@@ -202,9 +277,7 @@ def main():
     df['jhoveStatus'] = df['jhoveStatus'].replace(['Well-Formed, but not valid'], 'Not well-formed')
 
     desc = "JHOVE status vs rendering (lumping JHOVE's 'Well-Formed, but not valid' and 'Not well-formed' classes)"
-    V, p, dof = cramersVCorr(df['jhoveStatus'], df['rendersInAcrobat'])
-    row = pd.Series([desc, V, p, dof], index=['desc', 'V', 'p', 'dof'])
-    dfV = dfV.append(row, ignore_index=True)
+    dfV = addStatistics(dfV, desc, df['jhoveStatus'], df['rendersInAcrobat'])
 
     # Revert dataframe to original state
     df = dfTemp.copy()
@@ -213,9 +286,7 @@ def main():
     df['jhoveStatus'] = df['jhoveStatus'].replace(['Well-Formed, but not valid'], 'Well-Formed and valid')
 
     desc = "JHOVE status vs rendering (lumping JHOVE's 'Well-Formed, but not valid' and 'Well-Formed and valid' classes)"
-    V, p, dof = cramersVCorr(df['jhoveStatus'], df['rendersInAcrobat'])
-    row = pd.Series([desc, V, p, dof], index=['desc', 'V', 'p', 'dof'])
-    dfV = dfV.append(row, ignore_index=True)
+    dfV = addStatistics(dfV, desc, df['jhoveStatus'], df['rendersInAcrobat'])
 
     # Revert dataframe to original state
     df = dfTemp.copy()
@@ -228,19 +299,13 @@ def main():
     df['rendersInAcrobat'] = df['rendersInAcrobat'].replace(['YesWithIssues'], 'Yes')
 
     desc = "JHOVE status vs rendering (lumping 'Yes' and 'YesWithIssues' rendering classes)"
-    V, p, dof = cramersVCorr(df['jhoveStatus'], df['rendersInAcrobat'])
-    row = pd.Series([desc, V, p, dof], index=['desc', 'V', 'p', 'dof'])
-    dfV = dfV.append(row, ignore_index=True)
+    dfV = addStatistics(dfV, desc, df['jhoveStatus'], df['rendersInAcrobat'])
 
     desc = "VeraPDF parse errors vs rendering (lumping 'Yes' and 'YesWithIssues' rendering classes)"
-    V, p, dof = cramersVCorr(df['veraParseErrors'], df['rendersInAcrobat'])
-    row = pd.Series([desc, V, p, dof], index=['desc', 'V', 'p', 'dof'])
-    dfV = dfV.append(row, ignore_index=True)
+    dfV = addStatistics(dfV, desc, df['veraParseErrors'], df['rendersInAcrobat'])
 
     desc = "VeraPDF parse warnings vs rendering (lumping 'Yes' and 'YesWithIssues' rendering classes)"
-    V, p, dof = cramersVCorr(df['veraLogWarnings'], df['rendersInAcrobat'])
-    row = pd.Series([desc, V, p, dof], index=['desc', 'V', 'p', 'dof'])
-    dfV = dfV.append(row, ignore_index=True)
+    dfV = addStatistics(dfV, desc, df['veraLogWarnings'], df['rendersInAcrobat'])
 
     # Revert dataframe to original state
     df = dfTemp.copy()
@@ -249,19 +314,13 @@ def main():
     df['rendersInAcrobat'] = df['rendersInAcrobat'].replace(['YesWithIssues'], 'No')
 
     desc = "JHOVE status vs rendering (lumping 'No' and 'YesWithIssues' rendering classes)"
-    V, p, dof = cramersVCorr(df['jhoveStatus'], df['rendersInAcrobat'])
-    row = pd.Series([desc, V, p, dof], index=['desc', 'V', 'p', 'dof'])
-    dfV = dfV.append(row, ignore_index=True)
+    dfV = addStatistics(dfV, desc, df['jhoveStatus'], df['rendersInAcrobat'])
 
     desc = "VeraPDF parse errors vs rendering (lumping 'No' and 'YesWithIssues' rendering classes)"
-    V, p, dof = cramersVCorr(df['veraParseErrors'], df['rendersInAcrobat'])
-    row = pd.Series([desc, V, p, dof], index=['desc', 'V', 'p', 'dof'])
-    dfV = dfV.append(row, ignore_index=True)
+    dfV = addStatistics(dfV, desc, df['veraParseErrors'], df['rendersInAcrobat'])
 
     desc = "VeraPDF parse warnings vs rendering (lumping 'No' and 'YesWithIssues' rendering classes)"
-    V, p, dof = cramersVCorr(df['veraLogWarnings'], df['rendersInAcrobat'])
-    row = pd.Series([desc, V, p, dof], index=['desc', 'V', 'p', 'dof'])
-    dfV = dfV.append(row, ignore_index=True)
+    dfV = addStatistics(dfV, desc, df['veraLogWarnings'], df['rendersInAcrobat'])
 
     dfVmd = dfToMarkdown(dfV)
     with open("statistics.md", 'w', encoding='utf-8') as f:
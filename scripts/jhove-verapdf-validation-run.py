@@ -1,13 +1,24 @@
 #! /usr/bin/env python3
 
 import os
+import re
 import sys
 import glob
+import csv
+import mmap
+import math
+import time
+import random
+import datetime
 import argparse
+import importlib.util
+import concurrent.futures
 import subprocess as sub
 import xml.etree.ElementTree as ET
+import numpy as np
 import pandas as pd
 from tabulate import tabulate
+import reportstore
 
 """
 This script runs both JHOVE and VeraPDF on all files with a .pdf extension,
@@ -16,9 +27,55 @@ validation status and VeraPDF parse errors and logged warnings. Results are
 summarised in CSV file that can be further analyzed with script
 jhove-verapdf-validation-analyze.py.
 
+With the --stream option, the output of both tools is parsed while the tools are
+still running, and no intermediate output files are written. Use the --archive
+option to (optionally) keep the raw output of failing files, or of all files.
+
+With the --sample option, the tools are only run on a reproducible stratified
+random sample of the input files (strata by size band, PDF header version or
+subdirectory). The sampling weights are added to the CSV file, and weighted
+estimates of the proportions of all JHOVE and VeraPDF outcomes (with 95%
+confidence intervals) are written to file estimates.md.
+
+With the --jobs option, multiple files are processed in parallel. Files are
+scheduled by predicted processing time, so the slowest files are started first,
+and smaller files fill the gaps. Predictions are based on the processing times
+of earlier runs (which are recorded in file durations.csv in the output
+directory), and on file size.
+
+With the --watch option, the script keeps running, and polls the input
+directory for new or changed PDFs. Only those files are processed (by a pool of
+--jobs workers), and their results are appended to the CSV file as soon as they
+are available. Files are processed once their size and modification time are
+unchanged between two successive polls, so files that are still being copied
+into the input directory are skipped until they are complete. Stop with Ctrl-C;
+results of files that are still being processed at that moment are discarded,
+and these files are processed again by the next run. In watch mode the CSV file
+has an additional processed column (time stamp), so it can't be shared with
+runs without --watch.
+
+With the --preflight option, a quick pre-flight check of each PDF's structure
+is done before running JHOVE and VeraPDF. It only reads the first and last few
+KB of the file, and reports the header version, the startxref offset (and
+whether it points to a cross-reference section), and the presence of the
+trailer keyword and the end-of-file marker. The results are added as columns to
+the CSV file, and contingency tables of pre-flight outcome against JHOVE and
+VeraPDF results are written to file preflight.md. With --skipbroken, JHOVE and
+VeraPDF are not run on files that fail the pre-flight check.
+
+JHOVE and VeraPDF output is written to a report store in the output directory.
+With the --store option, the output is either written as files directly in the
+output directory (flat), as files in a hash-sharded directory tree (sharded), or
+to a single SQLite database (sqlite). See reportstore.py. The default is flat,
+or sharded with the --recursive option. A flat store names reports after the
+base names of the PDFs, so it can't be used with --recursive if PDFs in
+different subdirectories have identical base names, or in watch mode.
+
 Python requirements:
 
 - Pandas (https://pypi.org/project/pandas/)
+- Tabulate https://pypi.org/project/tabulate/)
+- SciPy (https://pypi.org/project/scipy/), only for --sample option
 
 Other requirements:
 
@@ -26,9 +83,13 @@ Other requirements:
 - veraPDF (tested with v. 1.22.3)
 """
 
-# Locations of JHOVE and VeraPDF
-jhoveBin = os.path.abspath("/home/johan/jhove/jhove")
-veraPDFBin = os.path.abspath("/home/johan/verapdf/verapdf")
+# Default locations of JHOVE and VeraPDF (override with --jhove and --verapdf
+# options, or JHOVE_BIN and VERAPDF_BIN environment variables)
+jhoveBin = os.path.abspath(os.environ.get("JHOVE_BIN", "/home/johan/jhove/jhove"))
+veraPDFBin = os.path.abspath(os.environ.get("VERAPDF_BIN", "/home/johan/verapdf/verapdf"))
+
+# Columns of CSV file in watch mode
+watchColumns = ["fileName", "jhoveStatus", "veraParseErrors", "veraLogWarnings", "processed"]
 
 # Create parser
 parser = argparse.ArgumentParser()
@@ -49,6 +110,94 @@ def parseCommandLine():
                         dest="existingOutputFlag",
                         default=False,
                         help="don't run JHOVE and VeraPDF, but use existing output")
+    parser.add_argument('--jhove',
+                        action="store",
+                        type=str,
+                        dest="jhoveBin",
+                        default=jhoveBin,
+                        help="location of JHOVE executable")
+    parser.add_argument('--verapdf',
+                        action="store",
+                        type=str,
+                        dest="veraPDFBin",
+                        default=veraPDFBin,
+                        help="location of VeraPDF executable")
+    parser.add_argument('--stream', '-s',
+                        action="store_true",
+                        dest="streamFlag",
+                        default=False,
+                        help="parse JHOVE and VeraPDF output while tools are running, \
+                        without writing intermediate output files")
+    parser.add_argument('--archive', '-a',
+                        action="store",
+                        type=str,
+                        choices=["none", "failing", "all"],
+                        dest="archive",
+                        default="none",
+                        help="in stream mode, write raw JHOVE and VeraPDF output for \
+                        failing files or all files to output directory")
+    parser.add_argument('--store',
+                        action="store",
+                        type=str,
+                        choices=reportstore.layouts,
+                        dest="store",
+                        default=None,
+                        help="layout of store for JHOVE and VeraPDF output \
+                        (default: flat, or sharded with --recursive)")
+    parser.add_argument('--recursive', '-r',
+                        action="store_true",
+                        dest="recursiveFlag",
+                        default=False,
+                        help="also process PDFs in subdirectories of input directory")
+    parser.add_argument('--jobs', '-j',
+                        action="store",
+                        type=int,
+                        dest="jobs",
+                        default=1,
+                        help="number of files that are processed in parallel")
+    parser.add_argument('--watch', '-w',
+                        action="store_true",
+                        dest="watchFlag",
+                        default=False,
+                        help="keep running, and process new or changed PDFs \
+                        in input directory as they arrive")
+    parser.add_argument('--interval',
+                        action="store",
+                        type=float,
+                        dest="interval",
+                        default=2,
+                        help="polling interval in seconds for --watch option")
+    parser.add_argument('--preflight', '-p',
+                        action="store_true",
+                        dest="preflightFlag",
+                        default=False,
+                        help="do pre-flight check of PDF structure, and report results")
+    parser.add_argument('--skipbroken',
+                        action="store_true",
+                        dest="skipBrokenFlag",
+                        default=False,
+                        help="don't run JHOVE and VeraPDF on files that fail pre-flight check")
+    parser.add_argument('--sample',
+                        action="store",
+                        type=int,
+                        dest="sampleSize",
+                        default=None,
+                        help="only process stratified random sample of (about) this size, \
+                        and report weighted estimates; each stratum gets at least 2 files, \
+                        so the actual sample can be larger")
+    parser.add_argument('--strata',
+                        action="store",
+                        type=str,
+                        choices=["size", "version", "subdir"],
+                        dest="strata",
+                        default="size",
+                        help="stratification variable for --sample option")
+    parser.add_argument('--seed',
+                        action="store",
+                        type=int,
+                        dest="seed",
+                        default=1,
+                        help="random seed for --sample option")
 
     # Parse arguments
     args = parser.parse_args()
@@ -63,10 +212,10 @@ def errorExit(msg):
     sys.exit(1)
 
 
-def runJhove(jhoveBin, fileIn, fileOut):
+def runJhove(jhoveBin, fileIn, store, fileID):
 
     """
-    Run JHOVE on one PDF
+    Run JHOVE on one PDF, and write output to store
     """
     args = [jhoveBin]
     args.append('-m')
@@ -75,17 +224,18 @@ def runJhove(jhoveBin, fileIn, fileOut):
     args.append('XML')
     args.append('-i')
     args.append(fileIn)
-    args.append('-o')
-    args.append(fileOut)
 
     p = sub.Popen(args, stdout=sub.PIPE, stderr=sub.PIPE, shell=False)
     output, errors = p.communicate()
 
+    # Write output (stdout) to store
+    store.write(fileID, "jhove", output)
+
 
-def runVeraPDF(veraPDFBin, fileIn, fileOut):
+def runVeraPDF(veraPDFBin, fileIn, store, fileID):
 
     """
-    Run VeraPDF on one PDF
+    Run VeraPDF on one PDF, and write output to store
     """
     args = [veraPDFBin]
     args.append('--off')
@@ -96,91 +246,904 @@ def runVeraPDF(veraPDFBin, fileIn, fileOut):
     p = sub.Popen(args, stdout=sub.PIPE, stderr=sub.PIPE, shell=False)
     output, errors = p.communicate()
 
-    # Write output (stdout) to file
-    with open(fileOut, 'wb') as f:
-        f.write(output)
+    # Write output (stdout) to store
+    store.write(fileID, "vera", output)
 
 
-def getJhoveResults(fileIn):
+def readChunks(f, chunkSize=65536, buffer=None):
 
     """
-    Return validation status from JHOVE output
+    Read binary file object f in chunks as soon as data becomes available, and
+    optionally append each chunk to buffer
     """
 
-    tree = ET.parse(fileIn)
-    root = tree.getroot()
+    while True:
+        chunk = f.read1(chunkSize)
+        if not chunk:
+            break
+        if buffer is not None:
+            buffer.append(chunk)
+        yield chunk
 
-    repInfo = root.find(".//{http://schema.openpreservation.org/ois/xml/ns/jhove}repInfo")
 
-    statusElt = repInfo.find(".//{http://schema.openpreservation.org/ois/xml/ns/jhove}status")
-    status = statusElt.text
+def readEvents(chunks):
 
-    return status
+    """
+    Feed chunks of XML to incremental parser, and yield "end" events as soon
+    as they become available. Elements are cleared after they are yielded,
+    so memory use doesn't grow with the size of the output
+    """
+
+    parser = ET.XMLPullParser(events=["end"])
+
+    for chunk in chunks:
+        parser.feed(chunk)
+        for event, elem in parser.read_events():
+            yield event, elem
+            elem.clear()
 
+    parser.close()
+    for event, elem in parser.read_events():
+        yield event, elem
+        elem.clear()
 
-def getVeraPDFResults(fileIn):
+
+def extractJhoveResults(events):
 
     """
-    Return two Boolean flags that indicate if VeraPDF output contains any parse errors
-    or logged warnings 
+    Return validation status from stream of JHOVE output events
     """
 
-    tree = ET.parse(fileIn)
-    root = tree.getroot()
+    status = None
+
+    for event, elem in events:
+        if elem.tag == "{http://schema.openpreservation.org/ois/xml/ns/jhove}status" and status is None:
+            status = elem.text
+
+    return status
+
+
+def extractVeraPDFResults(events):
+
+    """
+    Return two Boolean flags that indicate if stream of VeraPDF output events
+    contains any parse errors or logged warnings
+    """
 
-    job = root.find(".//job")
-        
     parseErrors = False
     logErrors = False # Don't think these are even a thing in VeraPDF?
     logWarnings = False
 
+    for event, elem in events:
+        if elem.tag == "taskResult":
+            if elem.get("type") == "PARSE" and elem.get("isSuccess") == "false":
+                parseErrors = True
+        elif elem.tag == "logMessage":
+            level = elem.get("level")
+            if level == "WARNING":
+                logWarnings = True
+            if level == "ERROR":
+                logErrors = True
+
+    return parseErrors, logWarnings
+
+
+def getJhoveResults(store, fileID):
+
+    """
+    Return validation status from JHOVE output in store
+    """
+
+    with store.open(fileID, "jhove") as f:
+        status = extractJhoveResults(readEvents(readChunks(f)))
+
+    return status
+
+
+def getVeraPDFResults(store, fileID):
+
+    """
+    Return two Boolean flags that indicate if VeraPDF output in store contains any
+    parse errors or logged warnings 
+    """
+
+    with store.open(fileID, "vera") as f:
+        parseErrors, logWarnings = extractVeraPDFResults(readEvents(readChunks(f)))
+
+    return parseErrors, logWarnings
+
+
+def streamTool(args, extractor, buffer=None):
+
+    """
+    Run tool with arguments args, and feed its output (stdout) to extractor
+    while the tool is still running. Raw output is appended to buffer if it is
+    not None. Returns extractor result, or None if output could not be parsed
+    """
+
+    p = sub.Popen(args, stdout=sub.PIPE, stderr=sub.DEVNULL, shell=False)
+
     try:
-        taskResults = job.findall(".//taskResult")
-
-        for taskResult in taskResults:
-            type = taskResult.get("type")
-            if type == "PARSE":
-                isSuccess = taskResult.get("isSuccess")
-                if isSuccess == "false":
-                    #exceptionMessage = taskResult.find(".//exceptionMessage")
-                    #exceptionMessageText = exceptionMessage.text
-                    parseErrors = True
-                    break
-    except:
+        result = extractor(readEvents(readChunks(p.stdout, buffer=buffer)))
+    except ET.ParseError:
+        result = None
+        # Drain remaining output so the tool doesn't block on a full pipe
+        for chunk in readChunks(p.stdout, buffer=buffer):
             pass
 
+    p.stdout.close()
+    p.wait()
+
+    return result
+
+
+def streamJhove(jhoveBin, fileIn, buffer=None):
+
+    """
+    Run JHOVE on one PDF, and return validation status from its output
+    """
+    args = [jhoveBin]
+    args.append('-m')
+    args.append('PDF-hul')
+    args.append('-h')
+    args.append('XML')
+    args.append('-i')
+    args.append(fileIn)
+
+    return streamTool(args, extractJhoveResults, buffer)
+
+
+def streamVeraPDF(veraPDFBin, fileIn, buffer=None):
+
+    """
+    Run VeraPDF on one PDF, and return parse error and warning flags from its output
+    """
+    args = [veraPDFBin]
+    args.append('--off')
+    args.append('--addlogs')
+    args.append('--extract')
+    args.append(fileIn)
+
+    result = streamTool(args, extractVeraPDFResults, buffer)
+
+    if result is None:
+        return None, None
+
+    return result
+
+
+def writeArchive(buffer, store, fileID, tool):
+
+    """
+    Write buffered raw tool output to store
+    """
+
+    store.write(fileID, tool, b"".join(buffer))
+
+
+def getHeaderVersion(head):
+
+    """
+    Return PDF version from header in bytes object head, or None if head
+    doesn't contain a PDF header
+    """
+
+    match = re.search(rb"%PDF-(\d+\.\d+)", head)
+    if match is None:
+        return None
+    return match.group(1).decode("ascii")
+
+
+def getStratum(pdfIn, dirIn, strata):
+
+    """
+    Return stratum of PDF for stratification variable strata
+    """
+
+    if strata == "size":
+        # Size bands with a factor 10 between successive band limits
+        size = os.path.getsize(pdfIn)
+        limits = [(1e5, "< 100 KB"), (1e6, "100 KB - 1 MB"), (1e7, "1 MB - 10 MB"),
+                  (1e8, "10 MB - 100 MB")]
+        for limit, band in limits:
+            if size < limit:
+                return band
+        return ">= 100 MB"
+
+    elif strata == "version":
+        # Version from PDF header, which should be in first 1024 bytes
+        with open(pdfIn, 'rb') as f:
+            head = f.read(1024)
+        version = getHeaderVersion(head)
+        if version is None:
+            return "no header"
+        return version
+
+    elif strata == "subdir":
+        subDir = os.path.dirname(os.path.relpath(pdfIn, dirIn))
+        if subDir == "":
+            return "."
+        return subDir
+
+
+def stratifiedSample(pdfsIn, dirIn, strata, sampleSize, seed):
+
+    """
+    Draw stratified random sample of sampleSize files from pdfsIn, using
+    proportional allocation. Each stratum gets at least two files (or all of
+    its files if it has fewer), so the variance within each stratum can be
+    estimated.
+    Returns list of sampled files, dictionaries with the stratum and sampling
+    weight of each sampled file, and dictionary with population size of each
+    stratum
+    """
+
+    population = {}
+
+    for pdfIn in sorted(pdfsIn):
+        stratum = getStratum(pdfIn, dirIn, strata)
+        population.setdefault(stratum, []).append(pdfIn)
+
+    noFiles = len(pdfsIn)
+    rng = random.Random(seed)
+
+    pdfsSample = []
+    fileStrata = {}
+    fileWeights = {}
+    strataSizes = {}
+
+    for stratum in sorted(population):
+        files = population[stratum]
+        noSample = round(sampleSize * len(files) / noFiles)
+        noSample = min(len(files), max(2, noSample))
+        for pdfIn in rng.sample(files, noSample):
+            pdfsSample.append(pdfIn)
+            fileStrata[pdfIn] = stratum
+            fileWeights[pdfIn] = len(files) / noSample
+        strataSizes[stratum] = len(files)
+
+    return pdfsSample, fileStrata, fileWeights, strataSizes
+
+
+def stratifiedEstimates(df, strataSizes, variables):
+
+    """
+    Return dataframe with stratified estimates of the proportion of each
+    category of variables in population, with standard errors and 95%
+    confidence intervals (normal approximation, with finite population
+    correction)
+    """
+
+    z = 1.96
+    noFiles = sum(strataSizes.values())
+    rows = []
+
+    for variable in variables:
+        values = df[variable].astype(str)
+        for category in sorted(values.unique()):
+            estimate = 0
+            variance = 0
+            for stratum, stratumSize in strataSizes.items():
+                inStratum = df["stratum"] == stratum
+                n = inStratum.sum()
+                if n == 0:
+                    continue
+                p = (values[inStratum] == category).mean()
+                w = stratumSize / noFiles
+                estimate += w * p
+                if n > 1:
+                    variance += w**2 * (1 - n/stratumSize) * p * (1 - p) / (n - 1)
+            se = math.sqrt(variance)
+            rows.append([variable, category, estimate, se,
+                         max(0, estimate - z*se), min(1, estimate + z*se)])
+
+    dfEst = pd.DataFrame(rows, columns=['variable', 'value', 'estimate', 'se', 'lower95', 'upper95'])
+
+    return dfEst
+
+
+def loadAnalyzeScript():
+
+    """
+    Load jhove-verapdf-validation-analyze.py as a module, so we can re-use
+    its contingency table and Cramer's V functions
+    """
+
+    scriptPath = os.path.split(os.path.realpath(__file__))[0]
+    analyzeScript = os.path.join(scriptPath, "jhove-verapdf-validation-analyze.py")
+    spec = importlib.util.spec_from_file_location("analyze", analyzeScript)
+    analyze = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(analyze)
+
+    return analyze
+
+
+def writeEstimates(df, strataSizes, strata, sampleSize, fileOut):
+
+    """
+    Write stratified estimates, weighted contingency tables and Cramer's V
+    statistics for sample to Markdown file
+    """
+
+    analyze = loadAnalyzeScript()
+
+    dfStrata = pd.DataFrame({'stratum': list(strataSizes.keys()),
+                             'population': list(strataSizes.values()),
+                             'sample': [(df['stratum'] == stratum).sum() for stratum in strataSizes]})
+
+    # Strata with only one sampled file (out of more than one) don't contribute
+    # to the estimated variance, so confidence intervals are too narrow
+    singletons = dfStrata[(dfStrata['sample'] == 1) & (dfStrata['population'] > 1)]
+
+    dfEst = stratifiedEstimates(df, strataSizes, ['jhoveStatus', 'veraParseErrors', 'veraLogWarnings'])
+
+    mdOut = "## Strata (" + strata + ")\n\n"
+    mdOut += ("Sample size: " + str(len(df)) + " files (requested: " + str(sampleSize) +
+              ") from population of " + str(sum(strataSizes.values())) + " files\n\n")
+    mdOut += analyze.dfToMarkdown(dfStrata, headers='keys') + "\n\n"
+    if len(singletons) > 0:
+        mdOut += ("**Warning**: only one file was sampled from stratum/strata " +
+                  ", ".join(singletons['stratum']) + ". Their variance can't be " +
+                  "estimated, so the confidence intervals below are too narrow.\n\n")
+    mdOut += "## Estimated proportions\n\n"
+    mdOut += analyze.dfToMarkdown(dfEst, headers='keys') + "\n\n"
+
+    # Weighted contingency tables (estimated population counts) and
+    # Cramer's V for sample
+    dfV = pd.DataFrame({'desc': [], 'V': [], 'p': [], 'dof': []})
+
+    for desc, column in [("JHOVE status vs VeraPDF parse errors", 'veraParseErrors'),
+                         ("JHOVE status vs VeraPDF warnings", 'veraLogWarnings')]:
+        contTab = pd.crosstab(index=df['jhoveStatus'], columns=df[column],
+                              values=df['weight'], aggfunc='sum', margins=True).fillna(0)
+        mdOut += "## " + desc + " (weighted)\n\n"
+        mdOut += analyze.dfToMarkdown(contTab) + "\n\n"
+
+        if df['jhoveStatus'].nunique() > 1 and df[column].nunique() > 1:
+            V, p, dof = analyze.cramersVCorr(df['jhoveStatus'], df[column])
+            dfV.loc[len(dfV)] = [desc, V, p, dof]
+
+    mdOut += "## Cramer's V (sample)\n\n"
+    mdOut += analyze.dfToMarkdown(dfV) + "\n"
+
+    with open(fileOut, 'w', encoding='utf-8') as f:
+        f.write(mdOut)
+
+
+def getFileID(pdfIn, dirIn):
+
+    """
+    Return ID of PDF in report store: path relative to dirIn, without extension
+    """
+
+    return os.path.splitext(os.path.relpath(pdfIn, dirIn))[0]
+
+
+def findDuplicateNames(pdfsIn):
+
+    """
+    Return sorted list of base names (without extension) that occur more than
+    once in pdfsIn
+    """
+
+    counts = {}
+
+    for pdfIn in pdfsIn:
+        baseName = os.path.splitext(os.path.basename(pdfIn))[0]
+        counts[baseName] = counts.get(baseName, 0) + 1
+
+    return sorted(baseName for baseName, count in counts.items() if count > 1)
+
+
+def processPDF(pdfIn, fileID, store, existingOutputFlag, streamFlag, archive):
+
+    """
+    Run JHOVE and VeraPDF on one PDF (unless existingOutputFlag is set), and
+    return JHOVE validation status and VeraPDF parse error and warning flags
+    """
+
+    if streamFlag:
+        # Run JHOVE and VeraPDF, and parse their output while they are running
+        if archive != "none":
+            bufJhove = []
+            bufVeraPDF = []
+        else:
+            bufJhove = None
+            bufVeraPDF = None
+
+        jhoveStatus = streamJhove(jhoveBin, pdfIn, bufJhove)
+        veraParseErrors, veraLogWarnings = streamVeraPDF(veraPDFBin, pdfIn, bufVeraPDF)
+
+        failed = (jhoveStatus != "Well-Formed and valid" or
+                  veraParseErrors is not False or
+                  veraLogWarnings is not False)
+
+        if archive == "all" or (archive == "failing" and failed):
+            writeArchive(bufJhove, store, fileID, "jhove")
+            writeArchive(bufVeraPDF, store, fileID, "vera")
+    else:
+        if not existingOutputFlag:
+            # Run JHOVE and VeraPDF
+            runJhove(jhoveBin, pdfIn, store, fileID)
+            runVeraPDF(veraPDFBin, pdfIn, store, fileID)
+
+        # Get JHOVE validation status from output file. Status is None if
+        # output could not be parsed (e.g. because JHOVE crashed)
+        try:
+            jhoveStatus = getJhoveResults(store, fileID)
+        except FileNotFoundError:
+             errorExit("JHOVE output files not found, try running without --existingoutput option")
+        except ET.ParseError:
+            jhoveStatus = None
+
+        # Get Boolean flags that indicate parse errors or log warnings
+        # in VeraPDF output file
+        try:
+            veraParseErrors, veraLogWarnings = getVeraPDFResults(store, fileID)
+        except FileNotFoundError:
+             errorExit("VeraPDF output files not found, try running without --existingoutput option")
+        except ET.ParseError:
+            veraParseErrors, veraLogWarnings = None, None
+
+    return jhoveStatus, veraParseErrors, veraLogWarnings
+
+
+def readDurations(fileIn):
+
+    """
+    Read processing times that were recorded by earlier runs. Returns
+    dictionary that maps file path to (size, duration, mtime) tuple, where
+    mtime is the modification time (ns) of the file when it was processed, or
+    None if it wasn't recorded. If a file path occurs more than once, its last
+    entry is used
+    """
+
+    durations = {}
+
+    if not os.path.isfile(fileIn):
+        return durations
+
+    with open(fileIn, 'r', encoding='utf-8', newline='') as f:
+        for row in csv.DictReader(f):
+            mtime = int(row["mtime"]) if row.get("mtime") else None
+            durations[row["filePath"]] = (int(row["size"]), float(row["duration"]), mtime)
+
+    return durations
+
+
+def writeDurations(durations, fileOut):
+
+    """
+    Write processing times to file
+    """
+
+    with open(fileOut, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["filePath", "size", "duration", "mtime"])
+        for filePath in sorted(durations):
+            size, duration, mtime = durations[filePath]
+            writer.writerow([filePath, size, duration, mtime])
+
+
+def appendDurations(rows, fileOut):
+
+    """
+    Append rows with (filePath, size, duration, mtime) to processing times
+    file, and write header if the file doesn't exist yet
+    """
+
+    writeHeader = not os.path.isfile(fileOut)
+
+    with open(fileOut, 'a', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        if writeHeader:
+            writer.writerow(["filePath", "size", "duration", "mtime"])
+        writer.writerows(rows)
+
+
+def fitDurations(durations):
+
+    """
+    Return (slope, intercept) of linear fit of duration against file size over
+    all recorded processing times. Without any recorded processing times, the
+    file size is used as a proxy for processing time
+    """
+
+    recSizes = [size for size, duration, mtime in durations.values()]
+    recDurations = [duration for size, duration, mtime in durations.values()]
+
+    if len(set(recSizes)) > 1:
+        slope, intercept = np.polyfit(recSizes, recDurations, 1)
+        slope = max(slope, 0)
+    elif recSizes:
+        slope = 0
+        intercept = np.mean(recDurations)
+    else:
+        slope = 1
+        intercept = 0
+
+    return slope, intercept
+
+
+def predictCosts(pdfsIn, durations, fit=None):
+
+    """
+    Return dictionary with predicted processing time of each file. For files
+    that were processed by an earlier run (and haven't changed size since) this
+    is the recorded processing time. Otherwise it is estimated from the file
+    size, using a linear fit (see fitDurations). A previously computed fit
+    can be passed as fit, to avoid refitting
+    """
+
+    sizes = {pdfIn: os.path.getsize(pdfIn) for pdfIn in pdfsIn}
+
+    if fit is None:
+        fit = fitDurations(durations)
+    slope, intercept = fit
+
+    costs = {}
+
+    for pdfIn, size in sizes.items():
+        if pdfIn in durations and durations[pdfIn][0] == size:
+            costs[pdfIn] = durations[pdfIn][1]
+        else:
+            costs[pdfIn] = intercept + slope * size
+
+    return costs
+
+
+def listPDFs(dirIn, recursiveFlag):
+
+    """
+    Return list of all files with .pdf extension in dirIn
+    """
+
+    if recursiveFlag:
+        pdfsIn = glob.glob(dirIn + '/**/*.pdf', recursive=True)
+    else:
+        pdfsIn = glob.glob(dirIn + '/*.pdf')
+
+    return pdfsIn
+
+
+def appendResults(rows, csvOut):
+
+    """
+    Append rows with results to CSV file, and write header if the file
+    doesn't exist yet
+    """
+
+    writeHeader = not os.path.isfile(csvOut)
+
+    with open(csvOut, 'a', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        if writeHeader:
+            writer.writerow(watchColumns)
+        writer.writerows(rows)
+
+
+def checkResultsHeader(csvOut):
+
+    """
+    Exit with error if CSV file exists, but wasn't written in watch mode (so
+    appended rows wouldn't match its columns)
+    """
+
+    if not os.path.isfile(csvOut):
+        return
+
+    with open(csvOut, 'r', encoding='utf-8', newline='') as f:
+        header = next(csv.reader(f), None)
+
+    if header != watchColumns:
+        errorExit("columns of " + csvOut + " don't match watch mode (written by run " +
+                  "without --watch?), use a different output directory")
+
+
+def collectResults(finished, running, dirIn, durations, csvOut, durationsFile):
+
+    """
+    Append results of finished futures to CSV file, and append their
+    processing times to processing times file. Files that changed after they
+    were processed get a new row, so for each file name the row with the
+    latest processed timestamp holds the current results. Processing times of
+    files with missing results (e.g. because a tool crashed) aren't recorded,
+    so these files are processed again by the next run. Returns number of
+    collected results
+    """
+
+    rows = []
+    durationRows = []
+
+    for future in finished:
+        pdfIn, (size, mtime) = running.pop(future)
+        results, duration = future.result()
+        fileName = getFileID(pdfIn, dirIn) + os.path.splitext(pdfIn)[1]
+        timeStamp = datetime.datetime.now().isoformat(timespec='seconds')
+        rows.append([fileName] + list(results) + [timeStamp])
+        if None not in results:
+            durationRows.append([pdfIn, size, duration, mtime])
+            durations[pdfIn] = (size, duration, mtime)
+
+    if rows:
+        appendResults(rows, csvOut)
+        appendDurations(durationRows, durationsFile)
+
+    return len(rows)
+
+
+def watchDirectory(dirIn, dirOut, store, recursiveFlag, jobs, interval, streamFlag, archive):
+
+    """
+    Poll dirIn for new or changed PDFs, process them with a pool of workers,
+    and append their results to the CSV file. Files that were processed by an
+    earlier run (according to the recorded processing times) are skipped if
+    their size and modification time haven't changed. Processing times are
+    appended to the processing times file while running, which is rewritten
+    (without any removed files) on shutdown
+    """
+
+    csvOut = os.path.join(dirOut, "data.csv")
+    checkResultsHeader(csvOut)
+    durationsFile = os.path.join(dirOut, "durations.csv")
+    durations = readDurations(durationsFile)
+
+    # State of files that were processed (or submitted for processing), and
+    # of files that were new or changed at the previous poll
+    processed = {}
+    pending = {}
+    running = {}
+    firstPoll = True
+    # Linear fit of recorded processing times, only updated after new
+    # processing times were recorded
+    fit = None
+
+    def timedProcessPDF(pdfIn):
+        start = time.perf_counter()
+        results = processPDF(pdfIn, getFileID(pdfIn, dirIn), store, False, streamFlag, archive)
+        duration = time.perf_counter() - start
+        return results, duration
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, jobs))
+
     try:
-        logMessages = job.findall(".//logs/logMessage")
+        while True:
+            ready = []
+            current = set()
 
-        for logMessage in logMessages:
-            level = logMessage.get("level")
-            if level == "WARNING":
-                    logWarnings = True
-            if level == "ERROR":
-                    logErrors = True
-    except:
-            pass
+            for pdfIn in listPDFs(dirIn, recursiveFlag):
+                try:
+                    stat = os.stat(pdfIn)
+                except FileNotFoundError:
+                    continue
+                state = (stat.st_size, stat.st_mtime_ns)
+                current.add(pdfIn)
 
-    return parseErrors, logWarnings
+                recorded = durations.get(pdfIn)
+                if firstPoll and recorded is not None and (recorded[0], recorded[2]) == state:
+                    processed[pdfIn] = state
+                elif processed.get(pdfIn) == state:
+                    pass
+                elif pending.get(pdfIn) == state:
+                    # Unchanged since previous poll, so ready for processing
+                    del pending[pdfIn]
+                    processed[pdfIn] = state
+                    ready.append(pdfIn)
+                else:
+                    pending[pdfIn] = state
+
+            # Forget about files that were removed
+            for pdfIn in set(pending) - current:
+                del pending[pdfIn]
+            for pdfIn in set(processed) - current:
+                del processed[pdfIn]
+                durations.pop(pdfIn, None)
+            if firstPoll:
+                for pdfIn in set(durations) - current:
+                    del durations[pdfIn]
+
+            firstPoll = False
+
+            # Submit ready files, slowest predicted files first
+            if ready:
+                if fit is None:
+                    fit = fitDurations(durations)
+                costs = predictCosts(ready, durations, fit)
+                for pdfIn in sorted(ready, key=lambda pdfIn: costs[pdfIn], reverse=True):
+                    future = executor.submit(timedProcessPDF, pdfIn)
+                    running[future] = (pdfIn, processed[pdfIn])
+
+            # Collect results of finished files
+            finished = [future for future in running if future.done()]
+            if collectResults(finished, running, dirIn, durations, csvOut, durationsFile) > 0:
+                fit = None
+
+            time.sleep(interval)
+
+    except KeyboardInterrupt:
+        # Ctrl-C in a terminal also interrupts the JHOVE and VeraPDF processes
+        # of files that are still running, so their results are discarded. As
+        # their processing times aren't recorded, the next run processes them
+        # again
+        sys.stderr.write("Stopping, discarding results of " + str(len(running)) +
+                         " unfinished file(s)\n")
+        executor.shutdown(wait=True, cancel_futures=True)
+        writeDurations(durations, durationsFile)
+
+
+def preflightPDF(pdfIn, headSize=1024, tailSize=4096):
+
+    """
+    Do quick pre-flight check of PDF structure, using memory-mapped reads of the
+    first headSize and last tailSize bytes of the file. Returns dictionary with
+    header version, startxref offset, flag that indicates if startxref offset
+    points to a cross-reference table or stream, and flags that indicate
+    presence of trailer keyword and end-of-file marker
+    """
+
+    results = {
+                "preHeaderVersion": None,
+                "preStartxref": None,
+                "preStartxrefValid": False,
+                "preTrailer": False,
+                "preEOF": False,
+                "preflightOK": False
+    }
+
+    with open(pdfIn, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return results
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            head = mm[:headSize]
+            tail = mm[max(0, size - tailSize):]
+
+            results["preHeaderVersion"] = getHeaderVersion(head)
+
+            # Last startxref keyword in file is the one that counts
+            matches = re.findall(rb"startxref\s+(\d+)", tail)
+            if matches:
+                offset = int(matches[-1])
+                results["preStartxref"] = offset
+                if offset < size:
+                    target = mm[offset:offset + 32]
+                    if re.match(rb"\s*(xref|\d+\s+\d+\s+obj)", target):
+                        results["preStartxrefValid"] = True
+
+            results["preTrailer"] = b"trailer" in tail
+            results["preEOF"] = b"%%EOF" in tail[-1024:]
+
+    # Note that files with cross-reference streams don't need a trailer keyword
+    results["preflightOK"] = (results["preHeaderVersion"] is not None and
+                              results["preStartxrefValid"] and
+                              results["preEOF"])
+
+    return results
+
+
+def writePreflightTables(df, fileOut):
+
+    """
+    Write contingency tables and Cramer's V statistics for pre-flight check
+    results against JHOVE and VeraPDF results to Markdown file
+    """
+
+    analyze = loadAnalyzeScript()
+
+    # Files without JHOVE and VeraPDF results (--skipbroken) are left out
+    noFiles = len(df)
+    df = df.dropna(subset=['jhoveStatus'])
+    noSkipped = noFiles - len(df)
+
+    preflightColumns = [('preflightOK', "Pre-flight OK"),
+                        ('preHeader', "Pre-flight header"),
+                        ('preStartxrefValid', "Pre-flight startxref valid"),
+                        ('preTrailer', "Pre-flight trailer"),
+                        ('preEOF', "Pre-flight EOF marker")]
+    resultColumns = [('jhoveStatus', "JHOVE status"),
+                     ('veraParseErrors', "VeraPDF parse errors"),
+                     ('veraLogWarnings', "VeraPDF warnings")]
+
+    df = df.assign(preHeader=df['preHeaderVersion'].notna())
+
+    dfV = pd.DataFrame({'desc': [], 'V': [], 'p': [], 'dof': []})
+    mdOut = ""
+
+    # If tools didn't run on all files, the tables only cover a subset of them,
+    # and if only one pre-flight outcome is left there is nothing to compare
+    if noSkipped > 0 or df['preflightOK'].nunique() < 2:
+        mdOut += "**Warning**: "
+        if noSkipped > 0:
+            mdOut += (str(noSkipped) + " of " + str(noFiles) + " files have no JHOVE " +
+                      "and VeraPDF results (e.g. because of --skipbroken), and are left " +
+                      "out of the tables below. ")
+        if df['preflightOK'].nunique() < 2:
+            mdOut += ("All files in the tables have the same pre-flight outcome, so " +
+                      "the tables can't show how pre-flight results relate to JHOVE " +
+                      "and VeraPDF results.")
+            if noSkipped > 0:
+                mdOut += " Run without --skipbroken to compare them."
+        mdOut += "\n\n"
+
+    for preColumn, preDesc in preflightColumns:
+        for resultColumn, resultDesc in resultColumns:
+            desc = preDesc + " vs " + resultDesc
+            contTab = pd.crosstab(index=df[resultColumn], columns=df[preColumn], margins=True)
+            mdOut += "## " + desc + "\n\n"
+            mdOut += analyze.dfToMarkdown(contTab) + "\n\n"
+
+            if df[preColumn].nunique() > 1 and df[resultColumn].nunique() > 1:
+                V, p, dof = analyze.cramersVCorr(df[preColumn], df[resultColumn])
+                dfV.loc[len(dfV)] = [desc, V, p, dof]
+
+    mdOut += "## Cramer's V\n\n"
+    mdOut += analyze.dfToMarkdown(dfV) + "\n"
+
+    with open(fileOut, 'w', encoding='utf-8') as f:
+        f.write(mdOut)
 
 
 def main():
     """Main processing loop"""
 
+    global jhoveBin, veraPDFBin
+
     # User input
     args = parseCommandLine()   
+    jhoveBin = os.path.abspath(args.jhoveBin)
+    veraPDFBin = os.path.abspath(args.veraPDFBin)
     dirIn = os.path.abspath(args.dirIn)
     dirOut = os.path.abspath(args.dirOut)
     existingOutputFlag = args.existingOutputFlag
+    streamFlag = args.streamFlag
+    archive = args.archive
+
+    recursiveFlag = args.recursiveFlag
+    sampleSize = args.sampleSize
+
+    if streamFlag and existingOutputFlag:
+        errorExit("--stream and --existingoutput options cannot be combined")
+
+    if sampleSize is not None and sampleSize < 1:
+        errorExit("sample size must be at least 1")
+
+    preflightFlag = args.preflightFlag or args.skipBrokenFlag
+
+    if args.watchFlag and (existingOutputFlag or sampleSize is not None or preflightFlag):
+        errorExit("--watch option cannot be combined with --existingoutput, --sample or --preflight options")
+
+    # Flat store names reports after base names, which aren't unique across
+    # subdirectories
+    if args.store is None:
+        args.store = "sharded" if recursiveFlag else "flat"
+
+    if args.watchFlag and recursiveFlag and args.store == "flat":
+        errorExit("--watch and --recursive options cannot be combined with flat store, use --store sharded or sqlite")
 
     # Check if input directory exists
     if not os.path.isdir(dirIn):
         errorExit("input directory does not exist")
 
+    # Check if JHOVE and VeraPDF exist
+    if not existingOutputFlag:
+        if not os.path.isfile(jhoveBin):
+            errorExit("JHOVE executable not found, use --jhove option to set its location")
+        if not os.path.isfile(veraPDFBin):
+            errorExit("VeraPDF executable not found, use --verapdf option to set its location")
+
     # Create output directory if it doesn't exist already
     if not os.path.isdir(dirOut):
         os.makedirs(dirOut)
 
+    # Open store for JHOVE and VeraPDF output
+    store = reportstore.openStore(dirOut, args.store)
+
+    if args.watchFlag:
+        watchDirectory(dirIn, dirOut, store, recursiveFlag, args.jobs, args.interval,
+                       streamFlag, archive)
+        store.close()
+        return
+
     # Create dictionary that will contain extracted data
     dataDict = {
                 "fileName": [],
@@ -190,51 +1153,113 @@ def main():
     }
 
     # Create list of all files with .pdf extension in dirIn
-    pdfsIn = glob.glob(dirIn + '/*.pdf')
+    pdfsIn = listPDFs(dirIn, recursiveFlag)
 
-    # Process all files, and add results to dictionary
-    for pdfIn in pdfsIn:
+    if recursiveFlag and args.store == "flat":
+        duplicateNames = findDuplicateNames(pdfsIn)
+        if duplicateNames:
+            errorExit("PDFs in different subdirectories have identical names (e.g. " +
+                      duplicateNames[0] + "), which a flat store can't keep apart; use --store sharded or sqlite")
 
-        # Strip path to get file name
-        fileName = os.path.basename(pdfIn)
-        # Strip file extension to get base name
-        baseName = os.path.splitext(fileName)[0]
+    if sampleSize is not None:
+        # Only process stratified random sample of files
+        pdfsIn, fileStrata, fileWeights, strataSizes = stratifiedSample(pdfsIn, dirIn, args.strata,
+                                                                        sampleSize, args.seed)
+        if len(pdfsIn) != sampleSize:
+            # Allocation is rounded per stratum, and each stratum gets at
+            # least 2 files
+            sys.stderr.write("Warning: sample size is " + str(len(pdfsIn)) + " files (requested: " +
+                             str(sampleSize) + ", " + str(len(strataSizes)) + " strata)\n")
+        dataDict["stratum"] = []
+        dataDict["weight"] = []
 
-        # Generate JHOVE and VeraPDF output file names
-        outJhove = os.path.join(dirOut, baseName + "-jhove.xml")
-        outVeraPDF = os.path.join(dirOut, baseName + "-vera.xml")
+    if preflightFlag:
+        # Pre-flight check of all files
+        preflightResults = {pdfIn: preflightPDF(pdfIn) for pdfIn in pdfsIn}
+        for column in ["preHeaderVersion", "preStartxref", "preStartxrefValid",
+                       "preTrailer", "preEOF", "preflightOK"]:
+            dataDict[column] = []
 
-        if not existingOutputFlag:
-            # Run JHOVE and VeraPDF
-            runJhove(jhoveBin, pdfIn, outJhove)
-            runVeraPDF(veraPDFBin, pdfIn, outVeraPDF)
+    if args.skipBrokenFlag:
+        # Don't run JHOVE and VeraPDF on files that fail pre-flight check
+        pdfsRun = [pdfIn for pdfIn in pdfsIn if preflightResults[pdfIn]["preflightOK"]]
+    else:
+        pdfsRun = pdfsIn
 
-        # Get JHOVE validation status from output file
-        try:
-            jhoveStatus = getJhoveResults(outJhove)
-        except FileNotFoundError:
-             errorExit("JHOVE output files not found, try running without --existingoutput option")
+    # Predict processing time of each file from earlier runs and file size,
+    # and schedule files in order of decreasing predicted time
+    durationsFile = os.path.join(dirOut, "durations.csv")
+    durations = readDurations(durationsFile)
+    costs = predictCosts(pdfsRun, durations)
+    pdfsScheduled = sorted(pdfsRun, key=lambda pdfIn: costs[pdfIn], reverse=True)
+
+    def timedProcessPDF(pdfIn):
+        start = time.perf_counter()
+        results = processPDF(pdfIn, getFileID(pdfIn, dirIn), store, existingOutputFlag,
+                             streamFlag, archive)
+        duration = time.perf_counter() - start
+        return results, duration
+
+    # Process all files
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, args.jobs)) as executor:
+        futures = {pdfIn: executor.submit(timedProcessPDF, pdfIn) for pdfIn in pdfsScheduled}
+
+    # Add results to dictionary
+    for pdfIn in pdfsIn:
+
+        if pdfIn in futures:
+            (jhoveStatus, veraParseErrors, veraLogWarnings), duration = futures[pdfIn].result()
+
+            if not existingOutputFlag and None not in (jhoveStatus, veraParseErrors, veraLogWarnings):
+                # Record processing time for scheduling of later runs
+                stat = os.stat(pdfIn)
+                durations[pdfIn] = (stat.st_size, duration, stat.st_mtime_ns)
+        else:
+            # Skipped after failed pre-flight check
+            jhoveStatus, veraParseErrors, veraLogWarnings = None, None, None
+
+        # Path relative to input directory, so files with identical names in
+        # different subdirectories can be told apart
+        fileName = getFileID(pdfIn, dirIn) + os.path.splitext(pdfIn)[1]
 
-        # Get Boolean flags that indicate parse errors or log warnings
-        # in VeraPDF output file
-        try:
-            veraParseErrors, veraLogWarnings = getVeraPDFResults(outVeraPDF)
-        except FileNotFoundError:
-             errorExit("VeraPDF output files not found, try running without --existingoutput option")
-    
         # Updata data dictionary
         dataDict["fileName"].append(fileName)
         dataDict["jhoveStatus"].append(jhoveStatus)
         dataDict["veraParseErrors"].append(veraParseErrors)
         dataDict["veraLogWarnings"].append(veraLogWarnings)
+        if sampleSize is not None:
+            dataDict["stratum"].append(fileStrata[pdfIn])
+            dataDict["weight"].append(fileWeights[pdfIn])
+        if preflightFlag:
+            for column, value in preflightResults[pdfIn].items():
+                dataDict[column].append(value)
+
+    store.close()
+
+    if not existingOutputFlag:
+        writeDurations(durations, durationsFile)
 
     # Convert dictionary to dataframe
     df = pd.DataFrame(dataDict)
 
+    if preflightFlag:
+        # Keep startxref offsets integer, even if some are missing
+        df['preStartxref'] = df['preStartxref'].astype('Int64')
+
      # Write all data to a CSV file
     csvOut = os.path.join(dirOut, "data.csv")
     df.to_csv(csvOut, encoding='utf-8', index=False)
 
+    if sampleSize is not None:
+        # Write weighted estimates for population
+        estimatesOut = os.path.join(dirOut, "estimates.md")
+        writeEstimates(df, strataSizes, args.strata, sampleSize, estimatesOut)
+
+    if preflightFlag:
+        # Write contingency tables for pre-flight check vs JHOVE and VeraPDF
+        preflightOut = os.path.join(dirOut, "preflight.md")
+        writePreflightTables(df, preflightOut)
+
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
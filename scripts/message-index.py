@@ -0,0 +1,362 @@
+#! /usr/bin/env python3
+
+import os
+import re
+import sys
+import argparse
+import sqlite3
+import multiprocessing as mp
+import xml.etree.ElementTree as ET
+from collections import Counter
+from tabulate import tabulate
+import reportstore
+
+"""
+This script builds a corpus-wide message frequency index from JHOVE and VeraPDF
+output in a report store (see reportstore.py). It extracts JHOVE messages,
+VeraPDF log messages and VeraPDF parse exception messages, normalises their
+texts (stripping file paths, offsets and object numbers), and counts them
+across all reports in the store. Reports are parsed by parallel workers, which
+return per-file message counts for each batch of reports. These are written to
+a staging table batch by batch, and aggregated by SQLite into an index database
+that maps each message to the files that have it. The index is built in a
+temporary file, which only replaces the existing index once it is complete.
+Once built, the index can be queried for the most frequent messages (--top), or
+for the files that contain a particular message (--message), without re-parsing
+any of the reports.
+
+Python requirements:
+
+- Tabulate https://pypi.org/project/tabulate/)
+"""
+
+jhoveNS = "{http://schema.openpreservation.org/ois/xml/ns/jhove}"
+
+# Patterns used for message normalisation. Only absolute paths with at least
+# two segments are treated as file paths, so PDF names such as /Pages are kept
+pathPattern = re.compile(r"(?:[A-Za-z]:)?[/\\][^\s/\\]+(?:[/\\][^\s/\\]+)+")
+numberPattern = re.compile(r"\b(?:0x[0-9A-Fa-f]+|\d+(?:\.\d+)?)\b")
+spacePattern = re.compile(r"\s+")
+
+# Create parser
+parser = argparse.ArgumentParser(
+description="Build and query frequency index of JHOVE and VeraPDF messages")
+
+def parseCommandLine():
+    # Add arguments
+
+    parser.add_argument('dirIn',
+                        action="store",
+                        type=str,
+                        help="output directory with JHOVE and VeraPDF report store")
+    parser.add_argument('dbOut',
+                        action="store",
+                        type=str,
+                        help="index database file")
+    parser.add_argument('--store',
+                        action="store",
+                        type=str,
+                        choices=reportstore.layouts,
+                        dest="store",
+                        default="flat",
+                        help="layout of report store (flat stores are searched recursively)")
+    parser.add_argument('--existingindex', '-e',
+                        action="store_true",
+                        dest="existingIndexFlag",
+                        default=False,
+                        help="don't parse any output files, but query existing index")
+    parser.add_argument('--workers', '-w',
+                        action="store",
+                        type=int,
+                        dest="workers",
+                        default=os.cpu_count(),
+                        help="number of parallel workers")
+    parser.add_argument('--top', '-t',
+                        action="store",
+                        type=int,
+                        dest="top",
+                        default=25,
+                        help="number of most frequent messages to report")
+    parser.add_argument('--tool',
+                        action="store",
+                        type=str,
+                        choices=["jhove", "vera"],
+                        dest="tool",
+                        default=None,
+                        help="only report messages from this tool")
+    parser.add_argument('--message', '-m',
+                        action="store",
+                        type=int,
+                        dest="messageID",
+                        default=None,
+                        help="list files that contain message with this index ID")
+
+    # Parse arguments
+    args = parser.parse_args()
+
+    return(args)
+
+
+def errorExit(msg):
+    """Print error to stderr and exit"""
+    msgString = ("Error: " + msg + "\n")
+    sys.stderr.write(msgString)
+    sys.exit(1)
+
+
+def normaliseMessage(text):
+    """
+    Normalise message text by replacing file paths and numbers (offsets,
+    object numbers, counts) with placeholders
+    """
+    if text is None:
+        return ""
+    text = pathPattern.sub("<path>", text)
+    text = numberPattern.sub("#", text)
+    text = spacePattern.sub(" ", text).strip()
+    return text
+
+
+def getJhoveMessages(root):
+
+    """
+    Return list of (code, level, text) tuples for all messages in JHOVE output
+    """
+
+    messages = []
+
+    for message in root.iter(jhoveNS + "message"):
+        code = message.get("id", "")
+        level = message.get("severity", "")
+        text = normaliseMessage(message.text)
+        messages.append((code, level, text))
+
+    return messages
+
+
+def getVeraPDFMessages(root):
+
+    """
+    Return list of (code, level, text) tuples for all parse exceptions and
+    logged messages in VeraPDF output
+    """
+
+    messages = []
+
+    for taskResult in root.iter("taskResult"):
+        if taskResult.get("type") == "PARSE" and taskResult.get("isSuccess") == "false":
+            exceptionMessage = taskResult.find("exceptionMessage")
+            if exceptionMessage is not None:
+                text = normaliseMessage(exceptionMessage.text)
+                messages.append(("", "PARSE", text))
+
+    for logMessage in root.iter("logMessage"):
+        level = logMessage.get("level", "")
+        text = normaliseMessage(logMessage.text)
+        messages.append(("", level, text))
+
+    return messages
+
+
+def indexFiles(batch):
+
+    """
+    Worker function: parse a batch of reports, and return list of (tool, code,
+    level, text, fileID, occurrences) rows with the number of occurrences of
+    each message in each file, and the number of parsed reports. Each worker
+    opens its own connection to the report store
+    """
+
+    dirIn, layout, reports = batch
+
+    store = reportstore.openStore(dirIn, layout)
+
+    rows = []
+    noParsed = 0
+
+    for fileID, tool in reports:
+        try:
+            with store.open(fileID, tool) as f:
+                root = ET.parse(f).getroot()
+        except ET.ParseError:
+            sys.stderr.write("Warning: could not parse " + tool + " output for " + fileID + "\n")
+            continue
+
+        if tool == "jhove":
+            messages = getJhoveMessages(root)
+        else:
+            messages = getVeraPDFMessages(root)
+
+        counts = Counter((tool, code, level, text) for code, level, text in messages)
+        rows += [key + (fileID, occurrences) for key, occurrences in counts.items()]
+        noParsed += 1
+
+    store.close()
+
+    return rows, noParsed
+
+
+def writeIndex(conn, results):
+
+    """
+    Write rows returned by workers to staging table, batch by batch, and
+    aggregate them into messages and messageFiles tables. Returns number of
+    parsed reports
+    """
+
+    conn.execute("""CREATE TABLE staging (
+                    tool TEXT,
+                    code TEXT,
+                    level TEXT,
+                    text TEXT,
+                    fileName TEXT,
+                    occurrences INTEGER)""")
+
+    noParsed = 0
+
+    for rows, partParsed in results:
+        conn.executemany("INSERT INTO staging VALUES (?, ?, ?, ?, ?, ?)", rows)
+        noParsed += partParsed
+
+    conn.execute("""CREATE TABLE messages (
+                    id INTEGER PRIMARY KEY,
+                    tool TEXT,
+                    code TEXT,
+                    level TEXT,
+                    text TEXT,
+                    occurrences INTEGER,
+                    files INTEGER)""")
+    conn.execute("""CREATE TABLE messageFiles (
+                    messageID INTEGER,
+                    fileName TEXT)""")
+
+    # Message IDs are assigned in order of decreasing occurrences
+    conn.execute("""INSERT INTO messages (tool, code, level, text, occurrences, files)
+                    SELECT tool, code, level, text, SUM(occurrences), COUNT(*) FROM staging
+                    GROUP BY tool, code, level, text
+                    ORDER BY SUM(occurrences) DESC, tool, code, level, text""")
+    conn.execute("CREATE UNIQUE INDEX idxMessageKeys ON messages (tool, code, level, text)")
+    conn.execute("""INSERT INTO messageFiles (messageID, fileName)
+                    SELECT messages.id, staging.fileName FROM staging
+                    JOIN messages USING (tool, code, level, text)
+                    ORDER BY messages.id, staging.fileName""")
+
+    conn.execute("DROP TABLE staging")
+    conn.execute("DROP INDEX idxMessageKeys")
+    conn.execute("CREATE INDEX idxMessageFiles ON messageFiles (messageID)")
+    conn.execute("CREATE INDEX idxFileMessages ON messageFiles (fileName)")
+    conn.commit()
+
+    return noParsed
+
+
+def buildIndex(dirIn, layout, dbOut, workers):
+
+    """
+    Parse all reports in store in dirIn with parallel workers, and write their
+    results to a temporary index database, which replaces the index database
+    dbOut once it is complete
+    """
+
+    store = reportstore.openStore(dirIn, layout)
+    reports = list(store.ids())
+    store.close()
+
+    if not reports:
+        errorExit("no JHOVE or VeraPDF output found in input directory")
+
+    # Split list of files into batches, so that each worker returns one
+    # partial result per batch instead of one result per file
+    workers = max(1, workers)
+    batchSize = max(1, min(1000, len(reports) // (workers * 4)))
+    batches = [(dirIn, layout, reports[i:i + batchSize]) for i in range(0, len(reports), batchSize)]
+
+    dbTemp = dbOut + ".tmp"
+    if os.path.isfile(dbTemp):
+        os.remove(dbTemp)
+
+    conn = sqlite3.connect(dbTemp)
+
+    try:
+        if workers == 1:
+            noParsed = writeIndex(conn, map(indexFiles, batches))
+        else:
+            with mp.Pool(workers) as pool:
+                noParsed = writeIndex(conn, pool.imap_unordered(indexFiles, batches))
+    except BaseException:
+        conn.close()
+        os.remove(dbTemp)
+        raise
+
+    conn.close()
+    os.replace(dbTemp, dbOut)
+
+    return noParsed
+
+
+def topMessages(dbOut, top, tool):
+
+    """
+    Return Markdown table with most frequent messages in index database
+    """
+
+    conn = sqlite3.connect(dbOut)
+
+    query = "SELECT id, tool, code, level, text, occurrences, files FROM messages"
+    params = []
+    if tool is not None:
+        query += " WHERE tool = ?"
+        params.append(tool)
+    query += " ORDER BY files DESC, occurrences DESC LIMIT ?"
+    params.append(top)
+
+    rows = conn.execute(query, params).fetchall()
+    conn.close()
+
+    headers = ["id", "tool", "code", "level", "text", "occurrences", "files"]
+    mdOut = tabulate(rows, headers=headers, tablefmt='pipe')
+
+    return mdOut
+
+
+def messageFileNames(dbOut, messageID):
+
+    """
+    Return list of files that contain message with ID messageID
+    """
+
+    conn = sqlite3.connect(dbOut)
+    rows = conn.execute("SELECT fileName FROM messageFiles WHERE messageID = ? ORDER BY fileName",
+                        (messageID,)).fetchall()
+    conn.close()
+
+    return [row[0] for row in rows]
+
+
+def main():
+    """Main processing loop"""
+
+    # User input
+    args = parseCommandLine()
+    dirIn = os.path.abspath(args.dirIn)
+    dbOut = os.path.abspath(args.dbOut)
+    existingIndexFlag = args.existingIndexFlag
+
+    if not existingIndexFlag:
+        # Check if input directory exists
+        if not os.path.isdir(dirIn):
+            errorExit("input directory does not exist")
+        noReports = buildIndex(dirIn, args.store, dbOut, args.workers)
+        sys.stderr.write("Indexed messages from " + str(noReports) + " reports\n")
+    elif not os.path.isfile(dbOut):
+        errorExit("index file not found, try running without --existingindex option")
+
+    if args.messageID is not None:
+        for fileName in messageFileNames(dbOut, args.messageID):
+            print(fileName)
+    else:
+        print(topMessages(dbOut, args.top, args.tool))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+import os
+import io
+import hashlib
+import sqlite3
+import threading
+
+"""
+Report stores for JHOVE and VeraPDF output. All stores map a file ID (the path
+of a PDF relative to the input directory, without extension) and a tool name
+("jhove" or "vera") to the raw output of that tool. Available layouts:
+
+- flat: <base>-jhove.xml and <base>-vera.xml files directly in the output
+  directory (original layout; identical base names in different
+  subdirectories overwrite each other)
+- sharded: one <hash>-<tool>.xml file per report in a two-level directory
+  tree under <dirOut>/reports, where the file and subdirectory names are
+  derived from a hash of the file ID. The file ID itself is kept in a
+  <hash>.id file next to the reports
+- sqlite: all reports as blobs in a single SQLite database <dirOut>/reports.sqlite
+
+Use openStore to create a store, and its write, open, ids, fingerprint and
+close methods to access it.
+"""
+
+layouts = ["flat", "sharded", "sqlite"]
+tools = ["jhove", "vera"]
+
+
+class FlatStore:
+
+    """
+    Reports as <base>-<tool>.xml files in output directory. Reports are always
+    written directly to the output directory, but reports in its subdirectories
+    (e.g. one per experiment) can be read as well
+    """
+
+    def __init__(self, dirOut):
+        self.dirOut = dirOut
+
+    def path(self, fileID, tool):
+        baseName = os.path.basename(fileID)
+        return os.path.join(self.dirOut, baseName + "-" + tool + ".xml")
+
+    def write(self, fileID, tool, data):
+        with open(self.path(fileID, tool), 'wb') as f:
+            f.write(data)
+
+    def readPath(self, fileID, tool):
+        """Return path of existing report, which may be in a subdirectory"""
+        nestedPath = os.path.join(self.dirOut, fileID + "-" + tool + ".xml")
+        if os.path.isfile(nestedPath):
+            return nestedPath
+        return self.path(fileID, tool)
+
+    def open(self, fileID, tool):
+        return open(self.readPath(fileID, tool), 'rb')
+
+    def ids(self):
+        """Yield (fileID, tool) tuples of all reports, searching output directory recursively"""
+        for dirPath, dirNames, fileNames in os.walk(self.dirOut):
+            for fileName in sorted(fileNames):
+                for tool in tools:
+                    suffix = "-" + tool + ".xml"
+                    if fileName.endswith(suffix):
+                        relPath = os.path.relpath(os.path.join(dirPath, fileName), self.dirOut)
+                        yield relPath[:-len(suffix)], tool
+
+    def fingerprint(self, fileIDs):
+        """Return fingerprint of reports of fileIDs, based on their number, sizes and modification times"""
+        return fileFingerprint([self.readPath(fileID, tool) for fileID in fileIDs for tool in tools])
+
+    def close(self):
+        pass
+
+
+class ShardedStore:
+
+    """
+    Reports in two-level directory tree, with file and directory names derived
+    from hash of file ID, so names don't exceed file system limits for long
+    file IDs. The file ID is stored in a sidecar file
+    """
+
+    def __init__(self, dirOut):
+        self.dirReports = os.path.join(dirOut, "reports")
+
+    def path(self, fileID, tool):
+        digest = hashlib.sha1(fileID.encode("utf-8")).hexdigest()
+        return os.path.join(self.dirReports, digest[0:2], digest[2:4], digest + "-" + tool + ".xml")
+
+    def idPath(self, fileID):
+        digest = hashlib.sha1(fileID.encode("utf-8")).hexdigest()
+        return os.path.join(self.dirReports, digest[0:2], digest[2:4], digest + ".id")
+
+    def write(self, fileID, tool, data):
+        fileOut = self.path(fileID, tool)
+        os.makedirs(os.path.dirname(fileOut), exist_ok=True)
+        with open(fileOut, 'wb') as f:
+            f.write(data)
+        idFile = self.idPath(fileID)
+        if not os.path.isfile(idFile):
+            with open(idFile, 'w', encoding='utf-8') as f:
+                f.write(fileID)
+
+    def open(self, fileID, tool):
+        return open(self.path(fileID, tool), 'rb')
+
+    def ids(self):
+        """Yield (fileID, tool) tuples of all reports"""
+        for dirPath, dirNames, fileNames in os.walk(self.dirReports):
+            dirNames.sort()
+            fileNames = set(fileNames)
+            for fileName in sorted(fileNames):
+                if not fileName.endswith(".id"):
+                    continue
+                digest = fileName[:-len(".id")]
+                with open(os.path.join(dirPath, fileName), 'r', encoding='utf-8') as f:
+                    fileID = f.read()
+                for tool in tools:
+                    if digest + "-" + tool + ".xml" in fileNames:
+                        yield fileID, tool
+
+    def fingerprint(self, fileIDs):
+        """Return fingerprint of reports of fileIDs, based on their number, sizes and modification times"""
+        return fileFingerprint([self.path(fileID, tool) for fileID in fileIDs for tool in tools])
+
+    def close(self):
+        pass
+
+
+class SQLiteStore:
+
+    """
+    Reports as blobs in single SQLite database. The connection is shared
+    between threads, so all access is serialised with a lock
+    """
+
+    def __init__(self, dirOut):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(dirOut, "reports.sqlite"),
+                                    check_same_thread=False)
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS reports (
+                             fileID TEXT,
+                             tool TEXT,
+                             data BLOB,
+                             PRIMARY KEY (fileID, tool))""")
+        self.conn.commit()
+
+    def write(self, fileID, tool, data):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO reports (fileID, tool, data) VALUES (?, ?, ?)",
+                              (fileID, tool, data))
+            self.conn.commit()
+
+    def open(self, fileID, tool):
+        with self.lock:
+            row = self.conn.execute("SELECT data FROM reports WHERE fileID = ? AND tool = ?",
+                                    (fileID, tool)).fetchone()
+        if row is None:
+            raise FileNotFoundError(fileID + " (" + tool + ")")
+        return io.BytesIO(row[0])
+
+    def ids(self):
+        """Yield (fileID, tool) tuples of all reports"""
+        with self.lock:
+            rows = self.conn.execute("SELECT fileID, tool FROM reports ORDER BY fileID, tool").fetchall()
+        for fileID, tool in rows:
+            yield fileID, tool
+
+    def fingerprint(self, fileIDs):
+        """
+        Return fingerprint of reports of fileIDs, based on their number, sizes
+        and largest row ID. Replaced reports get a new row ID, so the largest
+        row ID changes whenever a report is added or replaced
+        """
+        fileIDs = list(fileIDs)
+        noReports = 0
+        totalSize = 0
+        lastRowID = 0
+        # Query in chunks, to stay below SQLite's limit on number of parameters
+        chunkSize = 500
+        with self.lock:
+            for i in range(0, len(fileIDs), chunkSize):
+                chunk = fileIDs[i:i + chunkSize]
+                query = ("SELECT COUNT(*), SUM(LENGTH(data)), MAX(rowid) FROM reports WHERE fileID IN (" +
+                         ", ".join("?" * len(chunk)) + ")")
+                count, size, rowID = self.conn.execute(query, chunk).fetchone()
+                noReports += count
+                totalSize += size or 0
+                lastRowID = max(lastRowID, rowID or 0)
+        return str(noReports) + ":" + str(totalSize) + ":" + str(lastRowID)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def fileFingerprint(filePaths):
+
+    """
+    Return fingerprint of existing files in filePaths, based on their number,
+    sizes and modification times
+    """
+
+    noFiles = 0
+    totalSize = 0
+    lastModified = 0
+
+    for filePath in filePaths:
+        try:
+            stat = os.stat(filePath)
+        except FileNotFoundError:
+            continue
+        noFiles += 1
+        totalSize += stat.st_size
+        lastModified = max(lastModified, stat.st_mtime_ns)
+
+    return str(noFiles) + ":" + str(totalSize) + ":" + str(lastModified)
+
+
+def openStore(dirOut, layout):
+
+    """
+    Return report store with layout for output directory dirOut
+    """
+
+    if layout == "flat":
+        return FlatStore(dirOut)
+    elif layout == "sharded":
+        return ShardedStore(dirOut)
+    elif layout == "sqlite":
+        return SQLiteStore(dirOut)
+    else:
+        raise ValueError("unknown store layout: " + layout)
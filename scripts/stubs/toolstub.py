@@ -0,0 +1,182 @@
+import os
+import sys
+import json
+import time
+import random
+import zlib
+
+"""
+Stub versions of JHOVE and VeraPDF, for benchmarking the runner without real
+installs of both tools. The stubs accept the same command line arguments as the
+real tools (as used by jhove-verapdf-validation-run.py), and replay recorded
+reports from a directory tree (by default the output directory of this repo).
+
+A recorded report is selected by the base name of the input PDF. If there is no
+report for that base name, a report is picked deterministically from all
+recorded reports, so the stubs work on any set of input files.
+
+Behaviour is configured with environment variables:
+
+- STUB_REPLAY_DIR: directory with recorded <base>-jhove.xml and <base>-vera.xml
+  reports (searched recursively)
+- STUB_LATENCY: wall clock delay in seconds for each run (default 0)
+- STUB_CPU: CPU time in seconds that is burnt for each run (default 0)
+- STUB_FAILRATE: probability that a run fails, either by crashing without any
+  output, or by writing truncated output (default 0)
+- STUB_SEED: seed for failure injection (default 0). Failures are
+  deterministic for a given seed, tool and input file
+- STUB_INDEX: JSON file with index of recorded reports, as written by
+  writeIndex (optional). Without it, each run searches the replay directory.
+  The benchmark script writes the index once at startup, so the stubs don't
+  search the replay directory on every run
+"""
+
+scriptPath = os.path.split(os.path.realpath(__file__))[0]
+defaultReplayDir = os.path.join(os.path.dirname(os.path.dirname(scriptPath)), "output")
+
+
+def findReports(replayDir, tool):
+
+    """
+    Return dictionary that maps base names to recorded reports of tool
+    """
+
+    suffix = "-" + tool + ".xml"
+    reports = {}
+
+    for dirPath, dirNames, fileNames in os.walk(replayDir):
+        dirNames.sort()
+        for fileName in sorted(fileNames):
+            if fileName.endswith(suffix):
+                reports.setdefault(fileName[:-len(suffix)], os.path.join(dirPath, fileName))
+
+    return reports
+
+
+def writeIndex(replayDir, fileOut):
+
+    """
+    Write index of recorded reports of all tools in replayDir to JSON file
+    """
+
+    index = {tool: findReports(replayDir, tool) for tool in ["jhove", "vera"]}
+
+    with open(fileOut, 'w', encoding='utf-8') as f:
+        json.dump(index, f)
+
+
+def loadReports(replayDir, tool):
+
+    """
+    Return dictionary that maps base names to recorded reports of tool, from
+    index file in STUB_INDEX if it is set, and from replayDir otherwise
+    """
+
+    indexFile = os.environ.get("STUB_INDEX")
+
+    if indexFile:
+        with open(indexFile, 'r', encoding='utf-8') as f:
+            return json.load(f)[tool]
+
+    return findReports(replayDir, tool)
+
+
+def selectReport(reports, baseName):
+
+    """
+    Return recorded report for base name. If there is none, pick one
+    deterministically from all reports
+    """
+
+    if baseName in reports:
+        return reports[baseName]
+
+    names = sorted(reports)
+    return reports[names[zlib.crc32(baseName.encode("utf-8")) % len(names)]]
+
+
+def burnCPU(seconds):
+
+    """
+    Keep CPU busy for seconds of process time
+    """
+
+    end = time.process_time() + seconds
+    x = 0
+    while time.process_time() < end:
+        for i in range(10000):
+            x += i * i
+
+
+def parseToolArgs(tool, args):
+
+    """
+    Return input file and (optional) output file from tool arguments
+    """
+
+    fileIn = None
+    fileOut = None
+
+    if tool == "jhove":
+        for i, arg in enumerate(args[:-1]):
+            if arg == "-i":
+                fileIn = args[i + 1]
+            elif arg == "-o":
+                fileOut = args[i + 1]
+    elif args:
+        fileIn = args[-1]
+
+    return fileIn, fileOut
+
+
+def main(tool):
+
+    """
+    Replay recorded report of tool for input file given on command line
+    """
+
+    fileIn, fileOut = parseToolArgs(tool, sys.argv[1:])
+
+    if fileIn is None:
+        sys.stderr.write("Error: no input file\n")
+        sys.exit(1)
+
+    replayDir = os.environ.get("STUB_REPLAY_DIR", defaultReplayDir)
+    latency = float(os.environ.get("STUB_LATENCY", 0))
+    cpu = float(os.environ.get("STUB_CPU", 0))
+    failRate = float(os.environ.get("STUB_FAILRATE", 0))
+    seed = os.environ.get("STUB_SEED", "0")
+
+    reports = loadReports(replayDir, tool)
+
+    if not reports:
+        sys.stderr.write("Error: no recorded " + tool + " reports in " + replayDir + "\n")
+        sys.exit(1)
+
+    baseName = os.path.splitext(os.path.basename(fileIn))[0]
+
+    with open(selectReport(reports, baseName), 'rb') as f:
+        output = f.read()
+
+    if latency > 0:
+        time.sleep(latency)
+    if cpu > 0:
+        burnCPU(cpu)
+
+    rng = random.Random(seed + tool + baseName)
+
+    if rng.random() < failRate:
+        if rng.random() < 0.5:
+            # Crash without output
+            sys.stderr.write("Exception in thread \"main\" java.lang.OutOfMemoryError (stub)\n")
+            sys.exit(1)
+        else:
+            # Truncated output
+            output = output[:len(output) // 2]
+
+    if fileOut is not None:
+        with open(fileOut, 'wb') as f:
+            f.write(output)
+    else:
+        sys.stdout.buffer.write(output)
+        sys.stdout.flush()